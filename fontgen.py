@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""generates the packed bitmap font used for large LCD readouts
+
+file layout: width, height, first char code, glyph count (1 byte each)
+followed by the glyphs in framebuf.MONO_VLSB order, ceil(height / 8) * width bytes each
+
+usage: python fontgen.py src/fonts/digits_16x24.bin
+"""
+
+import sys
+
+W, H = 16, 24
+FIRST, LAST = " ", ":"
+T = 3  # stroke thickness
+
+# seven segment layout: (x, y, w, h)
+SEGMENTS = {
+    "a": (3, 1, 10, T),
+    "b": (12, 2, T, 10),
+    "c": (12, 12, T, 10),
+    "d": (3, 20, 10, T),
+    "e": (1, 12, T, 10),
+    "f": (1, 2, T, 10),
+    "g": (3, 11, 10, T - 1),
+}
+DIGITS = {
+    "0": "abcdef",
+    "1": "bc",
+    "2": "abdeg",
+    "3": "abcdg",
+    "4": "bcfg",
+    "5": "acdfg",
+    "6": "acdefg",
+    "7": "abc",
+    "8": "abcdefg",
+    "9": "abcdfg",
+}
+OTHER = {
+    "-": [SEGMENTS["g"]],
+    ".": [(6, 19, 4, 4)],
+    ":": [(6, 6, 4, 4), (6, 15, 4, 4)],
+    "%": [(1, 1, 5, 5), (10, 18, 5, 5)],
+}
+
+
+def glyph(ch):
+    px = [[0] * W for _ in range(H)]
+
+    def rect(x, y, w, h):
+        for yy in range(y, y + h):
+            for xx in range(x, x + w):
+                px[yy][xx] = 1
+
+    for seg in DIGITS.get(ch, ""):
+        rect(*SEGMENTS[seg])
+    for r in OTHER.get(ch, []):
+        rect(*r)
+    if ch == "%":
+        # diagonal stroke
+        for y in range(1, H - 1):
+            x = W - 2 - (y * (W - 3)) // (H - 2)
+            rect(max(x - 1, 0), y, 2, 1)
+
+    out = bytearray()
+    for page in range((H + 7) // 8):
+        for x in range(W):
+            byte = 0
+            for bit in range(8):
+                y = page * 8 + bit
+                if y < H and px[y][x]:
+                    byte |= 1 << bit
+            out.append(byte)
+    return out
+
+
+def main(path):
+    chars = [chr(c) for c in range(ord(FIRST), ord(LAST) + 1)]
+    with open(path, "wb") as f:
+        f.write(bytes((W, H, ord(FIRST), len(chars))))
+        for ch in chars:
+            f.write(glyph(ch))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
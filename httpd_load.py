@@ -0,0 +1,74 @@
+"""load test of the LAN HTTP API on the MicroPython unix port
+
+serves fake readings on loopback and keeps concurrent clients requesting
+/data, /relays and /metrics. Prints requests/s and the heap after every
+round, the heap must not grow round over round
+
+usage: cd src && micropython ../httpd_load.py [rounds] [requests] [clients]
+"""
+
+import gc
+import sys
+import time
+
+sys.path.append("lib")
+
+import uasyncio
+
+import config as CNFG
+from httpd import HttpApi
+
+PORT = 8080
+PATHS = (b"/data", b"/relays", b"/metrics")
+
+
+class Relay:
+    enabled = True
+
+    def on_time_ms(self):
+        return 1000
+
+
+class Data:
+    version = 1
+    ds18 = {b"\x28\x01\x5a": 21.5}
+    sht = {"cels": 22.1, "hum": 55.0}
+    bh1750 = 12345
+    ads = [40, 41, 0, 55]
+    ads_avg = 45.33
+
+
+async def client(n, stats):
+    for i in range(n):
+        reader, writer = await uasyncio.open_connection("127.0.0.1", PORT)
+        writer.write(b"GET " + PATHS[i % len(PATHS)] + b" HTTP/1.0\r\n\r\n")
+        await writer.drain()
+        if (await reader.readline()).startswith(b"HTTP/1.0 200"):
+            stats[0] += 1
+        while await reader.read(256):
+            pass
+        writer.close()
+        await writer.wait_closed()
+
+
+async def main(rounds, requests, clients):
+    CNFG.HTTP_API_PORT = PORT
+    hw = {name: Relay() for name in CNFG.RELAY}
+    api = HttpApi(hw, Data())
+    await api.serve()
+    for r in range(rounds):
+        stats = [0]
+        start = time.ticks_ms()
+        await uasyncio.gather(
+            *(client(requests // clients, stats) for _ in range(clients))
+        )
+        elapsed = time.ticks_diff(time.ticks_ms(), start) / 1000
+        gc.collect()
+        print(
+            "round %d: %d ok, %.0f req/s, heap %d B"
+            % (r, stats[0], stats[0] / elapsed, gc.mem_alloc())
+        )
+
+
+args = [int(a) for a in sys.argv[1:]]
+uasyncio.run(main(*(args + [5, 600, 4][len(args) :])))
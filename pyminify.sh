@@ -24,7 +24,7 @@ minify () {
     for pathname in "$1"/*; do
         if [ -d "$pathname" ]; then
             minify "$pathname"
-        else
+        elif [[ $pathname == *.py ]]; then
             echo "$pathname"
             pyminify $pathname >> "$pathname.min"
             rm $pathname
@@ -0,0 +1,185 @@
+# cloud backends - the interface cr_cloud talks to
+from collections import namedtuple
+
+import uasyncio
+
+import config as CNFG
+import log_setup
+from backoff import CircuitBreaker
+
+logger = log_setup.getLogger("backend")
+
+Setting = namedtuple("Setting", ["name", "vpin", "cast", "get", "set"])
+
+
+def cast_bool(value):
+    # "0"/"1" as returned by the server
+    return int(value) == 1
+
+
+def cast_int(value):
+    # sliders may be configured with decimals, thresholds are whole %
+    return int(float(value))
+
+
+CASTS = {bool: cast_bool, int: cast_int, float: float}
+
+
+def pump_get(hw):
+    return hw[CNFG.R_ID_PUMP].cloud_allow
+
+
+def pump_set(hw, value):
+    hw[CNFG.R_ID_PUMP].cloud_allow = value
+
+
+def config_get(name):
+    return lambda hw: getattr(CNFG, name)
+
+
+def config_set(name):
+    return lambda hw, value: setattr(CNFG, name, value)
+
+
+# where the fetched value of each cloud setting lives
+ACCESSORS = {
+    "EN_PUMP": (pump_get, pump_set),
+    "TRG_SOIL": (config_get("TRG_SOIL"), config_set("TRG_SOIL")),
+    "TRG_ATM": (config_get("TRG_ATM"), config_set("TRG_ATM")),
+}
+
+
+class Backend:
+    """base for cloud backends
+
+    subclasses push readings in `update_streams` and deliver cloud settings
+    either by polling in `fetch_settings` or by push, processed in `wait`"""
+
+    def __init__(self):
+        self.settings = []
+        for name, typ in CNFG.BL_SETTINGS.items():
+            getter, setter = ACCESSORS[name]
+            self.settings.append(
+                Setting(name, CNFG.BL_VPIN[name], CASTS[typ], getter, setter)
+            )
+        self.callbacks = {}
+        self.breaker = CircuitBreaker()
+
+    def on_change(self, name, callback):
+        """register callback(old, new) fired when cloud setting `name` changes"""
+        self.callbacks.setdefault(name, []).append(callback)
+
+    def create_payload(self, hw, data) -> list:
+        """(vpin, value) pairs of current readings and relay states"""
+        values = []
+
+        # DS18
+        # cached readings only - built on every cr_cloud loop, must not touch the bus
+        if data.ds18:
+            for pin, id in CNFG.DS_IDS.items():
+                try:
+                    if data.ds18[id]:
+                        values.append((pin, data.ds18[id]))
+                except KeyError:
+                    logger.warn(f"DS18 {id} not in data dict")
+        # BH1750
+        # 0 lx is a common value, we want to send those too
+        if data.bh1750 or data.bh1750 == 0:
+            values.append((CNFG.BL_VPIN["BH1750"], data.bh1750))
+
+        # ADS
+        if data.ads:
+            for i, pin in enumerate(CNFG.BL_VPIN["ADS"]):
+                values.append((pin, data.ads[i]))
+
+        # SHT3X
+        if data.sht:
+            if data.sht["cels"]:
+                values.append((CNFG.BL_VPIN["SHT"][0], data.sht["cels"]))
+            if data.sht["hum"]:
+                values.append((CNFG.BL_VPIN["SHT"][1], data.sht["hum"]))
+
+        # relays
+        if CNFG.R_ID_LIGHT in hw.keys():
+            if hw[CNFG.R_ID_LIGHT].enabled:
+                values.append((CNFG.BL_VPIN["R_LGHT"], 1))
+            else:
+                values.append((CNFG.BL_VPIN["R_LGHT"], 0))
+
+        if CNFG.R_ID_FAN in hw.keys():
+            if hw[CNFG.R_ID_FAN].enabled:
+                values.append((CNFG.BL_VPIN["R_FAN"], 1))
+            else:
+                values.append((CNFG.BL_VPIN["R_FAN"], 0))
+
+        if CNFG.R_ID_PUMP in hw.keys():
+            if hw[CNFG.R_ID_PUMP].low_level():
+                values.append((CNFG.BL_VPIN["WTR_LVL"], 1))
+            else:
+                values.append((CNFG.BL_VPIN["WTR_LVL"], 0))
+
+            if hw[CNFG.R_ID_PUMP].enabled:
+                values.append((CNFG.BL_VPIN["R_PUMP"], 1))
+            else:
+                values.append((CNFG.BL_VPIN["R_PUMP"], 0))
+
+        return values
+
+    def comm_failed(self, hw):
+        """feed the breaker; ask for a Wi-Fi reconnect once the circuit trips open"""
+        if self.breaker.failure():
+            logger.warn("Requesting Wi-Fi reconnection")
+            hw["wifi"].request_reconnect()
+
+    def apply_setting(self, hw, setting, raw):
+        """cast the raw cloud value, store it and fire change callbacks"""
+        try:
+            new = setting.cast(raw)
+        except (ValueError, TypeError):
+            logger.warn(f"Failed to read {setting.name} from cloud")
+            logger.debug(
+                "'%s' value returned by server: %s", setting.name, raw, fmt=True
+            )
+            return
+        limits = CNFG.BL_LIMITS.get(setting.name)
+        if limits and not limits[0] <= new <= limits[1]:
+            # a mis-set slider would run the relay constantly or never
+            logger.warn(
+                f"Cloud setting {setting.name}={new} outside {limits[0]}..{limits[1]}, ignored"
+            )
+            return
+        old = setting.get(hw)
+        if new == old:
+            return
+        setting.set(hw, new)
+        logger.debug(
+            "Cloud setting %s changed from %s to %s", setting.name, old, new, fmt=True
+        )
+        for callback in self.callbacks.get(setting.name, ()):
+            callback(old, new)
+
+    def update_streams(self, hw, data, payload=None):
+        """push readings, returns True if they reached the cloud
+        `payload` from create_payload saves building it twice"""
+        # never raise here, cr_cloud would die with it
+        logger.error(f"{type(self).__name__} does not push readings")
+        return False
+
+    def fetch_settings(self, hw):
+        logger.error(f"{type(self).__name__} does not fetch settings")
+        return False
+
+    async def wait(self, hw, seconds):
+        """idle until the next update; push backends process incoming data here"""
+        await uasyncio.sleep(seconds)
+
+
+def get_backend(name=CNFG.CLOUD_BACKEND):
+    """import only the selected backend to save RAM"""
+    if name == "mqtt":
+        from mqtt import MqttApi
+
+        return MqttApi()
+    from blynk import BlApi
+
+    return BlApi()
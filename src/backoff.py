@@ -0,0 +1,104 @@
+# retry scheduling with exponential backoff and a circuit breaker
+import time
+import random
+
+from micropython import const
+
+import config as CNFG
+import log_setup
+
+logger = log_setup.getLogger("backoff")
+
+CLOSED = const(0)  # requests go through
+OPEN = const(1)  # requests are skipped until the backoff expires
+HALF_OPEN = const(2)  # single probe allowed, its result decides the next state
+
+STATE_NAME = {CLOSED: "closed", OPEN: "open", HALF_OPEN: "half-open"}
+
+
+class CircuitBreaker:
+    """tracks failures of an unreliable operation and decides whether to attempt it
+
+    every failure doubles the wait before the next attempt (capped, with jitter),
+    after `threshold` consecutive failures the circuit opens and `allow()` keeps
+    returning False without touching the network until the wait expires.
+    A single probe then decides if the circuit closes again"""
+
+    def __init__(
+        self,
+        base=CNFG.CLOUD_BACKOFF_BASE,
+        cap=CNFG.CLOUD_BACKOFF_MAX,
+        threshold=CNFG.CLOUD_BREAKER_THRESHOLD,
+    ):
+        self.base_ms = base * 1000
+        self.cap_ms = cap * 1000
+        self.threshold = threshold
+
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.delay_ms = 0
+        self.next_attempt = time.ticks_ms()
+
+        # counters
+        self.attempts = 0
+        self.successes = 0
+        self.failures_total = 0
+        self.skipped = 0
+        self.opened = 0
+
+    def backoff_ms(self):
+        """exponential delay for the current failure count with +-25 % jitter"""
+        delay = min(self.cap_ms, self.base_ms << min(self.failures - 1, 16))
+        jitter = delay // 4
+        if jitter:
+            delay += random.getrandbits(16) % (2 * jitter) - jitter
+        return delay
+
+    def waiting(self):
+        return time.ticks_diff(self.next_attempt, time.ticks_ms()) > 0
+
+    def allow(self) -> bool:
+        """cheap check done before each attempt"""
+        if self.state == HALF_OPEN or (self.failures and self.waiting()):
+            self.skipped += 1
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            logger.info("Circuit half-open, probing")
+        self.attempts += 1
+        return True
+
+    def success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuit closed after {self.failures} failures")
+        self.state = CLOSED
+        self.failures = 0
+        self.delay_ms = 0
+        self.successes += 1
+
+    def failure(self) -> bool:
+        """record a failed attempt, returns True if the circuit just opened"""
+        self.failures += 1
+        self.failures_total += 1
+        self.delay_ms = self.backoff_ms()
+        self.next_attempt = time.ticks_add(time.ticks_ms(), self.delay_ms)
+
+        just_opened = self.state == CLOSED and self.failures >= self.threshold
+        if just_opened or self.state == HALF_OPEN:
+            self.state = OPEN
+            if just_opened:
+                self.opened += 1
+            logger.warn(f"Circuit open. Next attempt in {self.delay_ms // 1000} s")
+        return just_opened
+
+    def stats(self) -> dict:
+        return {
+            "state": STATE_NAME[self.state],
+            "failures": self.failures,
+            "delay_ms": self.delay_ms,
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "failures_total": self.failures_total,
+            "skipped": self.skipped,
+            "opened": self.opened,
+        }
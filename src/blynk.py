@@ -1,72 +1,49 @@
 import gc
+import time
+import ujson
+import usocket
 import lib.urequests as urequests
 import config as CNFG
 import log_setup
+from backend import Backend
+from backoff import HALF_OPEN
+import metrics
 
 
 logger = log_setup.getLogger("api")
 
 
-class BlApi:
-    def __init__(self):
-        pass
-
-    def create_payload(self, hw, data):
-
-        values = []
-
-        # DS18
-        if len(hw["ds18"].scan()) > 0:
-            for pin, id in CNFG.DS_IDS.items():
-                try:
-                    if data.ds18[id]:
-                        values.append((pin, data.ds18[id]))
-                except KeyError:
-                    logger.warn(f"DS18 {id} not in data dict")
-        # BH1750
-        # 0 lx is a common value, we want to send those too
-        if data.bh1750 or data.bh1750 == 0:
-            values.append((CNFG.BL_VPIN["BH1750"], data.bh1750))
-
-        # ADS
-        if data.ads:
-            for i, pin in enumerate(CNFG.BL_VPIN["ADS"]):
-                values.append((pin, data.ads[i]))
-
-        # SHT3X
-        if data.sht:
-            if data.sht["cels"]:
-                values.append((CNFG.BL_VPIN["SHT"][0], data.sht["cels"]))
-            if data.sht["hum"]:
-                values.append((CNFG.BL_VPIN["SHT"][1], data.sht["hum"]))
-
-        # relays
-        if CNFG.R_ID_LIGHT in hw.keys():
-            if hw[CNFG.R_ID_LIGHT].enabled:
-                values.append((CNFG.BL_VPIN["R_LGHT"], 1))
-            else:
-                values.append((CNFG.BL_VPIN["R_LGHT"], 0))
-
-        if CNFG.R_ID_FAN in hw.keys():
-            if hw[CNFG.R_ID_FAN].enabled:
-                values.append((CNFG.BL_VPIN["R_FAN"], 1))
-            else:
-                values.append((CNFG.BL_VPIN["R_FAN"], 0))
-
-        if CNFG.R_ID_PUMP in hw.keys():
-            if hw[CNFG.R_ID_PUMP].low_level():
-                values.append((CNFG.BL_VPIN["WTR_LVL"], 1))
-            else:
-                values.append((CNFG.BL_VPIN["WTR_LVL"], 0))
+class BlApi(Backend):
+    """Blynk HTTP API - readings pushed in a batch, settings polled"""
 
-            if hw[CNFG.R_ID_PUMP].enabled:
-                values.append((CNFG.BL_VPIN["R_PUMP"], 1))
-            else:
-                values.append((CNFG.BL_VPIN["R_PUMP"], 0))
-
-        return values
+    def probe(self, hw) -> bool:
+        """cheap reachability check - Wi-Fi link and a bare TCP connect to the cloud"""
+        if not hw["wifi"].is_up():
+            return False
+        host = CNFG.BLYNK_SINGLE_URL.split("/", 3)[2]
+        sock = None
+        try:
+            addr = usocket.getaddrinfo(host, 80, 0, usocket.SOCK_STREAM)[0][-1]
+            sock = usocket.socket()
+            sock.settimeout(CNFG.CLOUD_PROBE_TIMEOUT)
+            sock.connect(addr)
+            return True
+        except OSError as exc:
+            logger.debug(f"Cloud probe failed. {exc}")
+            return False
+        finally:
+            if sock:
+                sock.close()
+            del host, sock
+
+    def cloud_comm(self, payload, push_data=False, **kw):
+        if not self.breaker.allow():
+            logger.debug("Cloud comm skipped - backing off")
+            return
+        if self.breaker.state == HALF_OPEN and not self.probe(kw["hw"]):
+            self.comm_failed(kw["hw"])
+            return
 
-    def cloud_comm(self, payload, push_data=False, reattempt=False, **kw):
         if push_data:
             url = CNFG.BLYNK_BULK_URL
         else:
@@ -75,78 +52,105 @@ class BlApi:
         logger.debug(url)
         resp = urequests.Response("")
 
+        start = time.ticks_ms()
         try:
             if push_data:
                 resp = urequests.get(url, timeout=CNFG.HTTP_TIMEOUT)
             else:
                 resp = urequests.get(url, json=True, timeout=CNFG.HTTP_TIMEOUT)
+            metrics.histograms["cloud_request_seconds"].observe(
+                time.ticks_diff(time.ticks_ms(), start) / 1000
+            )
+            if resp.status_code >= 500:
+                # server side outage - back off, the link itself is fine so
+                # no Wi-Fi reconnect as comm_failed would request
+                logger.error(f"Cloud server error {resp.status_code}")
+                self.breaker.failure()
+                return
+            # 2xx/4xx - the cloud is up, a refused payload is not worth backing off
+            self.breaker.success()
+            if resp.handshake_ms is not None:
+                logger.debug("TLS handshake took %d ms", resp.handshake_ms, fmt=True)
 
             if push_data and resp.status_code == 200:
                 logger.info("API updated")
+                return True
             elif not push_data and resp.status_code == 200:
                 logger.debug("Data fetched")
                 return resp.text
             else:
                 # API works, server refused payload
                 logger.error("Failed to comm with cloud")
-                logger.debug(resp.__dict__)
+                logger.debug("Response: %s", resp.__dict__, fmt=True)
 
         except OSError as exc:
-            # ignore known error and try to reconnect
+            # EHOSTUNREACH is a known error during outages
             if not "EHOSTUNREACH" in str(exc):
                 logger.critical(exc)
-            elif reattempt:
-                logger.error("Reattempted cloud comm failed too..")
-            # try again - once!
-            if not reattempt:
-                logger.warn("Reattempting Wi-Fi connection and to cloud comm")
-                kw["hw"]["wifi"].attempt_connection(lcd=kw["hw"]["lcd"], reset=True)
-                self.cloud_comm(payload, reattempt=True, push_data=push_data, **kw)
+            self.comm_failed(kw["hw"])
 
         except MemoryError as exc:
             if "memory allocation failed" in str(exc):
                 logger.warn("Connection attempt failed to allocate memory")
                 gc.collect()
-                if not reattempt:
-                    self.cloud_comm(payload, reattempt=True, push_data=push_data, **kw)
-                else:
-                    logger.critical("Cloud comm reattempt failed")
+            self.comm_failed(kw["hw"])
+
+        except Exception as exc:
+            # malformed response (ValueError), redirect (NotImplementedError), ..
+            # must still reach the breaker, a half-open circuit would hang otherwise
+            logger.error(f"Cloud comm failed. {exc!r}")
+            self.comm_failed(kw["hw"])
 
         finally:
             resp.close()
-            del resp
+            del resp, url
+
+    def decode_settings(self, text) -> dict:
+        """turn the multi-pin get response into {"V<pin>": raw_value}"""
+        if len(self.settings) == 1:
+            # single pin get returns the bare value, not a JSON object
+            return {f"V{self.settings[0].vpin}": text}
+        values = {}
+        for key, value in ujson.loads(text).items():
+            values[key.upper()] = value
+        return values
 
-    def fetch_pump_setting(self, hw):
-        logger.info("Fetching cloud pump switch state")
-        old_state = hw[CNFG.R_ID_PUMP].cloud_allow
+    def fetch_settings(self, hw):
+        """read all cloud-controlled settings in a single request and apply them"""
+        logger.info("Fetching cloud settings")
         # JSON has to be set to True, otherwise socket read failes to detect 0
         # "0"/"1" is a JSON payload also per wireshark
-        state = self.cloud_comm(f"V{CNFG.BL_VPIN['EN_PUMP']}", api_func="get", hw=hw)
+        payload = "&".join([f"V{setting.vpin}" for setting in self.settings])
+        resp = self.cloud_comm(payload, api_func="get", hw=hw)
+        del payload
+        if resp is None:
+            # cloud_comm logged the reason already
+            return
         try:
-            state = int(state)
-            if state == 1:
-                hw[CNFG.R_ID_PUMP].cloud_allow = True
-            else:
-                hw[CNFG.R_ID_PUMP].cloud_allow = False
-
-            if old_state != hw[CNFG.R_ID_PUMP].cloud_allow:
-                logger.debug(
-                    f"Pump cloud_allow switch changed from {old_state} to {hw[CNFG.R_ID_PUMP].cloud_allow}"
-                )
-
-        except (ValueError, TypeError):
-            logger.warn("Failed to read pump switch state from cloud")
-            logger.debug(f"'state' value returned by server: {state}")
-        finally:
-            del state, old_state
-
-    def update_streams(self, hw, data):
-        logger.info("Preparing API payload")
-        payload = self.create_payload(hw, data)
+            values = self.decode_settings(resp)
+        except (ValueError, AttributeError):
+            logger.warn("Failed to decode cloud settings")
+            logger.debug("value returned by server: %s", resp, fmt=True)
+            return
+
+        for setting in self.settings:
+            try:
+                raw = values[f"V{setting.vpin}"]
+            except KeyError:
+                logger.warn(f"Cloud setting {setting.name} missing in response")
+                continue
+            self.apply_setting(hw, setting, raw)
+        del values
+
+    def update_streams(self, hw, data, payload=None):
+        if payload is None:
+            logger.info("Preparing API payload")
+            payload = self.create_payload(hw, data)
         logger.debug(payload)
         # make it a single string joined by &
         payload = "&".join([f"V{meas[0]}={meas[1]}" for meas in payload])
 
         logger.info("Sending data to cloud")
-        self.cloud_comm(payload, push_data=True, hw=hw)
+        sent = self.cloud_comm(payload, push_data=True, hw=hw)
         del payload
+        return bool(sent)
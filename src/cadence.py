@@ -0,0 +1,71 @@
+# adaptive cloud upload cadence
+import time
+
+import config as CNFG
+import log_setup
+
+logger = log_setup.getLogger("cadence")
+
+# any change of these is uploaded right away (within T_NETWORK_MIN)
+STATE_VPINS = (
+    CNFG.BL_VPIN["R_FAN"],
+    CNFG.BL_VPIN["R_LGHT"],
+    CNFG.BL_VPIN["R_PUMP"],
+    CNFG.BL_VPIN["WTR_LVL"],
+)
+
+
+class UploadCadence:
+    """decides when readings are worth uploading
+
+    while readings or relay states move, uploads happen every `t_min` seconds.
+    Each upload of flat data doubles the interval up to `t_max`"""
+
+    def __init__(self, t_min=CNFG.T_NETWORK_MIN, t_max=CNFG.T_NETWORK_MAX):
+        self.t_min = t_min
+        self.t_max = t_max
+        self.interval = t_min
+        self.last = {}  # vpin -> last uploaded value
+        self.last_upload = None
+        self.changing = False
+
+        # metrics
+        self.uploads = 0
+        self.started = time.ticks_ms()
+
+    def changed(self, payload) -> bool:
+        """significant change against the last uploaded values"""
+        for pin, value in payload:
+            old = self.last.get(pin)
+            if old is None:
+                return True
+            if pin in STATE_VPINS:
+                if value != old:
+                    return True
+            elif abs(value - old) > max(abs(old) * CNFG.CADENCE_DELTA, 1):
+                return True
+        return False
+
+    def due(self, payload) -> bool:
+        if self.last_upload is None:
+            return True
+        elapsed = time.ticks_diff(time.ticks_ms(), self.last_upload) // 1000
+        self.changing = self.changed(payload)
+        if self.changing:
+            self.interval = self.t_min
+        return elapsed >= self.interval
+
+    def uploaded(self, payload):
+        if not self.changing and self.last_upload is not None:
+            self.interval = min(self.t_max, self.interval * 2)
+        self.last = dict(payload)
+        self.last_upload = time.ticks_ms()
+        self.uploads += 1
+        logger.debug(
+            "Next upload in %d s unless readings change", self.interval, fmt=True
+        )
+
+    def rate(self) -> float:
+        """average uploads per hour since boot"""
+        elapsed = time.ticks_diff(time.ticks_ms(), self.started) / 3600000
+        return self.uploads / elapsed if elapsed else 0
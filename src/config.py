@@ -2,6 +2,15 @@ from array import array
 from micropython import const
 
 LOG_LEVEL = const(20)  # 10 = DEBUG; 20 = INFO
+# log file on flash, None to disable; records are buffered in RAM
+# and written every T_LOG_FLUSH sec., when the buffer fills up or on ERROR and up
+LOG_FILE = None
+LOG_FILE_LEVEL = const(30)
+# LOG_BUDGET bytes of history split into LOG_FILES files: LOG_FILE, LOG_FILE.1, ..
+LOG_BUDGET = const(262144)
+LOG_FILES = const(4)
+LOG_BUFFER = const(1024)
+T_LOG_FLUSH = const(30)
 
 
 # ----------------------------------------
@@ -38,11 +47,40 @@ NETWORKS = {
 DHCP_HOSTNAME = const("boxmon")
 # how much seconds wait for WiFi to assign an IP
 WIFI_CONNECT_TIMEOUT = const(10)
+# the last good SSID/BSSID/channel/IP are kept here for a fast targeted reconnect
+WIFI_CACHE_FILE = const("wifi_cache.json")
+# sec. for which scan results are reused when reconnecting
+WIFI_SCAN_CACHE = const(300)
+# sec. between rescans when the last results didn't get us connected
+WIFI_RESCAN_MIN = const(60)
+# sec. for the targeted reconnect before falling back to the full one
+WIFI_FAST_CONNECT_TIMEOUT = const(3)
+# (ip, netmask, gateway, dns) to skip DHCP on fast reconnects to the cached SSID
+# None = DHCP; connecting to any other SSID always uses DHCP
+WIFI_STATIC_IP = None
+# reuse the cached DHCP lease on fast reconnects (make sure the router reserves it)
+WIFI_REUSE_LEASE = False
+# ms between link status checks while connecting / while connected
+WIFI_STATUS_POLL = const(250)
+WIFI_LINK_POLL = const(2000)
+# sec. to wait after all SSIDs failed before trying again
+WIFI_RETRY_DELAY = const(30)
 # how many times wifi attempts to reconnect before complete restart
 RECONN_ATTEMPT = const(5)
 # sec. used for API requests
 HTTP_TIMEOUT = const(10)
 
+NTP_HOST = const("pool.ntp.org")
+# sec. between RTC syncs; picked from the measured drift within the bounds
+NTP_MIN_INTERVAL = const(900)
+NTP_MAX_INTERVAL = const(21600)
+NTP_MAX_ERROR = const(500)  # ms of RTC error tolerated between syncs
+NTP_RETRY_DELAY = const(60)  # sec. between attempts until the first sync
+# port of the on-device HTTP API serving /data and /relays; 0 = disabled
+HTTP_API_PORT = const(80)
+# bytes of the fixed buffer /metrics is rendered through
+METRICS_BUFFER = const(512)
+
 
 # ----------------------------------------
 #                 CLOUD
@@ -54,6 +92,17 @@ BLYNK_SINGLE_URL = (
 BLYNK_BULK_URL = (
     "https://fra1.blynk.cloud/external/api/batch/update?token=%s&" % BLYNK_TOKEN
 )
+# "blynk" = HTTP polling of Blynk.cloud; "mqtt" = persistent connection to MQTT_HOST
+CLOUD_BACKEND = const("blynk")
+
+# failed cloud comm is retried with exponential backoff (+ jitter), seconds
+CLOUD_BACKOFF_BASE = const(30)
+CLOUD_BACKOFF_MAX = const(900)
+# consecutive failures after which the circuit opens and cloud comm is skipped
+CLOUD_BREAKER_THRESHOLD = const(3)
+# sec. for the TCP connect probe done before closing the circuit again
+CLOUD_PROBE_TIMEOUT = const(2)
+
 # blynk virtual pin mapping
 BL_VPIN = {
     # light senser
@@ -69,6 +118,24 @@ BL_VPIN = {
     "EN_PUMP": const(14),
     # water level
     "WTR_LVL": const(13),
+    # cloud-controlled thresholds
+    "TRG_SOIL": const(18),
+    "TRG_ATM": const(19),
+}
+
+# settings read from the cloud in a single multi-pin request
+# names map to accessors in blynk.ACCESSORS, values are cast to the given type
+# the whole request fails if one of the datastreams is missing in the template,
+# add V18/V19 there before enabling the thresholds
+BL_SETTINGS = {
+    "EN_PUMP": bool,
+    # "TRG_SOIL": int,
+    # "TRG_ATM": int,
+}
+# accepted range of numeric cloud settings, values outside are ignored
+BL_LIMITS = {
+    "TRG_SOIL": (const(5), const(95)),
+    "TRG_ATM": (const(5), const(95)),
 }
 
 # the IDs double as virtual pins for blynk!
@@ -77,13 +144,34 @@ DS_IDS = {
     1: b"(\xac\xa4v\xe0\xff<\xe9",  # ['0x28', '0xac', '0xa4', '0x76', '0xe0', '0xff', '0x3c', '0xe9']
 }
 
+# MQTT backend
+MQTT_HOST = const("192.168.1.10")
+MQTT_PORT = const(1883)
+MQTT_USER = None
+MQTT_PASSWORD = None
+# sec.; PINGREQ every half of it, reconnect after 1.5x without PINGRESP
+MQTT_KEEPALIVE = const(60)
+MQTT_QOS = const(0)  # 0 or 1 for published readings
+# readings are published to <MQTT_TOPIC>/V<vpin>
+# settings are received from <MQTT_TOPIC>/set/<BL_SETTINGS name>
+MQTT_TOPIC = const("boxmon")
+MQTT_POLL_INTERVAL = const(200)  # ms between checks for pushed settings
+
 # ----------------------------------------
 #                 TIMERS
 # ----------------------------------------
 T_MEAS = const(5)  # how often refresh data from sensors
 T_LCD_FRAME = const(5)  # how long single LCD frame is displayed
+T_LCD_ALERT = const(3)  # how long an alert slide is displayed between the others
+PUMP_MAX_RUN = const(600)  # sec. of continuous pumping reported as a pump fault
 T_RELAY = const(5)  # how often do we check in relay control loop
-T_NETWORK_UPDATE = const(60)  # how often to push data to cloud
+T_NETWORK_UPDATE = const(60)  # how often to fetch settings from cloud
+# readings are pushed every T_NETWORK_MIN while changing,
+# the interval doubles with each flat upload up to T_NETWORK_MAX
+T_NETWORK_MIN = const(15)
+T_NETWORK_MAX = const(900)
+CADENCE_DELTA = 0.05  # relative change of a reading considered significant
+T_HISTORY = const(120)  # readings averaged into one chart sample, LCD_W samples = ~4 h
 T_BUS_DELAY = const(
     0.2
 )  # used for troubleshooting to slow down read operations from I2C
@@ -134,6 +222,20 @@ I2C_LOOKUP = {
 LCD_W = const(128)
 LCD_H = const(64)
 LCD_MAX_CHAR = const(16)
+LCD_CONTRAST = const(0xFF)
+LCD_CONTRAST_DIM = const(0x08)
+# display power schedule: (start, end, "dim" or "off"), may cross midnight
+# applied only once the RTC is synced
+LCD_SCHEDULE = [
+    ("23:00", "06:00", "off"),
+    ("20:00", "23:00", "dim"),
+]
+LCD_WAKE_TIME = const(60)  # sec. at full contrast after a button press or an alert
+LCD_DIM_STRETCH = const(3)  # slides stay this many times longer while dimmed
+LCD_BUTTON = None  # pin of a wake button to GND (pulled up), None = no button
+LCD_FONT = "fonts/digits_16x24.bin"  # large digits, generated by fontgen.py
+LCD_FONT_CACHE = const(12)  # glyphs kept in RAM
+HISTORY_LEN = LCD_W  # chart samples kept per reading, one column each
 
 # ----------------------------------------
 #                 ADS1115 - anything related to reading analog values from soil sensors
@@ -1,6 +1,8 @@
 import time
+from array import array
 import config as CNFG
 from bh1750 import BH1750
+import metrics
 
 import log_setup
 
@@ -30,6 +32,7 @@ def meas_sht3x(sht) -> dict:
         return {"cels": m["temp_celsius"], "hum": m["humidity"]}
     except OSError as exc:
         logger.error(f"SHT3X - Failed to get_measurement. {exc}")
+        metrics.inc("i2c_errors_total", "SHT3X")
         return {"cels": 0, "hum": 0}
 
 
@@ -38,6 +41,7 @@ def meas_bh1750(bh) -> float:
         return int(bh.luminance(BH1750.ONCE_HIRES_1))
     except:
         logger.error("BH1750 - Failed to read luminance")
+        metrics.inc("i2c_errors_total", "BH1750")
         return 0
 
 
@@ -58,15 +62,68 @@ def meas_ads1115(ads) -> list:
             del meas
         except Exception as exc:
             logger.error(f"ADS1115 - failed to read channel {channel}. {exc}")
+            metrics.inc("i2c_errors_total", "ADS1115")
             out.append(0)  # to prevent missing indexes
     return out
 
 
+class History:
+    """fixed size ring of recent samples of one reading, for the LCD charts
+
+    readings are averaged over T_HISTORY seconds into a single sample"""
+
+    def __init__(self, size=CNFG.HISTORY_LEN, period=CNFG.T_HISTORY):
+        self.samples = array("H", (0 for _ in range(size)))
+        self.size = size
+        self.period = period * 1000
+        self.head = 0  # next write position
+        self.count = 0
+        self.version = 0  # bumped with every stored sample
+        self.lo = 0
+        self.hi = 0
+        self.acc = 0
+        self.acc_n = 0
+        self.started = time.ticks_ms()
+
+    def add(self, value):
+        self.acc += value
+        self.acc_n += 1
+        if time.ticks_diff(time.ticks_ms(), self.started) >= self.period:
+            self.append(self.acc / self.acc_n)
+            self.acc = 0
+            self.acc_n = 0
+            self.started = time.ticks_ms()
+
+    def append(self, value):
+        self.samples[self.head] = max(0, min(int(value), 65535))
+        self.head = (self.head + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        self.update_bounds()
+        self.version += 1
+
+    def last(self):
+        return self.samples[(self.head - 1) % self.size]
+
+    def update_bounds(self):
+        """min and max of the stored samples, kept in lo and hi"""
+        lo = hi = self.last()
+        i = self.head
+        for _ in range(self.count):
+            i = (i - 1) % self.size
+            value = self.samples[i]
+            if value < lo:
+                lo = value
+            elif value > hi:
+                hi = value
+        self.lo = lo
+        self.hi = hi
+
+
 class Data:
     """data storage and interface to measurement methods"""
 
     def __init__(self):
-        self.lcd_messages = []
         self.ds18 = {}
         self.sht = {}
         self.sht_cond_buffer = [False] * CNFG.TRG_COUNT
@@ -77,15 +134,21 @@ class Data:
         self.ads_avg = 0
         self.ads_cond_buffer = [False] * CNFG.TRG_COUNT
 
+        # bumped whenever a reading changes, lets consumers cache derived data
+        self.version = 0
+
+        self.history = {"soil": History(), "hum": History(), "light": History()}
+
     def update_condition_buffer(self, buffer, value):
         buffer.pop(0)
         buffer.append(value)
 
     def print_condition_buffer_state(self, name, buffer):
         logger.debug(
-            "{} delay buffer: {}x True vs {}x False".format(
-                name, buffer.count(True), buffer.count(False)
-            )
+            "%s delay buffer: %dx True vs %dx False",
+            name,
+            buffer.count(True),
+            buffer.count(False),
         )
 
     def evaluate_condition_buffer(self, buffer):
@@ -97,23 +160,40 @@ class Data:
             return True
         return False
 
-    def lcd_store_frame(self, msg):
-        self.lcd_messages.append(msg)
-
     def update_ds18(self, device):
-        self.ds18 = meas_ds18(device)
-        logger.debug(f"DS18: {self.ds18}")
+        ds18 = meas_ds18(device)
+        if ds18 != self.ds18:
+            self.ds18 = ds18
+            self.version += 1
+        logger.debug("DS18: %s", self.ds18, fmt=True)
+
+    def clear_ds18(self):
+        """sensors disappeared from the bus, stop reporting their last readings"""
+        if self.ds18:
+            self.ds18 = {}
+            self.version += 1
 
     def update_sht3x(self, device):
-        self.sht = meas_sht3x(device)
-        logger.debug(f"SHT3X {self.sht}")
+        sht = meas_sht3x(device)
+        if sht != self.sht:
+            self.sht = sht
+            self.version += 1
+        self.history["hum"].add(self.sht["hum"])
+        logger.debug("SHT3X %s", self.sht, fmt=True)
 
     def update_bh1750(self, device):
-        self.bh1750 = meas_bh1750(device)
-        logger.debug(f"BH1750 {self.bh1750}")
+        bh1750 = meas_bh1750(device)
+        if bh1750 != self.bh1750:
+            self.bh1750 = bh1750
+            self.version += 1
+        self.history["light"].add(self.bh1750)
+        logger.debug("BH1750 %s", self.bh1750, fmt=True)
 
     def update_ads(self, device):
-        self.ads = meas_ads1115(device)
+        ads = meas_ads1115(device)
+        if ads != self.ads:
+            self.ads = ads
+            self.version += 1
         # compute average
         soil_hum = None
         if self.ads:
@@ -125,4 +205,5 @@ class Data:
                 )
             else:
                 self.ads_avg = sum(soil_hum) / len(soil_hum)
-        logger.debug(f"ADS1115 {self.ads}")
+                self.history["soil"].add(self.ads_avg)
+        logger.debug("ADS1115 %s", self.ads, fmt=True)
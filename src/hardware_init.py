@@ -1,5 +1,5 @@
 from collections import namedtuple
-from time import sleep
+from time import sleep, ticks_ms, ticks_diff
 
 from machine import Pin, I2C, SoftI2C
 
@@ -26,16 +26,30 @@ class RelayControlled:
         self.name = name
         self.switch = pin
         self.enabled = False
+        # accumulated on-time of finished runs and start of the current one
+        self.on_ms = 0
+        self.on_since = None
 
     def on(self):
         logger.info(f"Turned on - {self.name}")
         self.enabled = True
         self.switch.value(0)
+        if self.on_since is None:
+            self.on_since = ticks_ms()
 
     def off(self):
         logger.info(f"Turned off - {self.name}")
         self.enabled = False
         self.switch.value(1)
+        if self.on_since is not None:
+            self.on_ms += ticks_diff(ticks_ms(), self.on_since)
+            self.on_since = None
+
+    def on_time_ms(self):
+        """total time spent switched on, including the current run"""
+        if self.on_since is None:
+            return self.on_ms
+        return self.on_ms + ticks_diff(ticks_ms(), self.on_since)
 
 
 class Pump(RelayControlled):
@@ -87,7 +101,17 @@ def setup_lcd(i2c):
 
 
 def setup_gfx(display):
-    gfx = GFX(CNFG.LCD_W, CNFG.LCD_H, display.pixel)
+    # native framebuf primitives instead of per-pixel Python callbacks
+    fb = display.framebuf
+    gfx = GFX(
+        CNFG.LCD_W,
+        CNFG.LCD_H,
+        fb.pixel,
+        hline=fb.hline,
+        vline=fb.vline,
+        fill_rect=fb.fill_rect,
+        line=fb.line,
+    )
     return gfx
 
 
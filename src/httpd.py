@@ -0,0 +1,122 @@
+# LAN HTTP API serving readings as JSON
+import ujson
+from ubinascii import hexlify
+
+import uasyncio
+
+import config as CNFG
+import log_setup
+import metrics
+
+logger = log_setup.getLogger("httpd")
+
+HEADER = "HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+METRICS_HEADER = b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nConnection: close\r\n\r\n"
+NOT_FOUND = b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def response(obj) -> bytes:
+    """complete HTTP response with the JSON body"""
+    body = ujson.dumps(obj)
+    return (HEADER % len(body) + body).encode()
+
+
+class HttpApi:
+    """serves /data and /relays from pre-serialized responses
+
+    the responses are rebuilt only when the data changed since the last
+    request, so polling costs neither sensor reads nor JSON encoding.
+    /metrics is streamed through a fixed buffer allocated once"""
+
+    def __init__(self, hw, data):
+        self.hw = hw
+        self.data = data
+        self.routes = {
+            b"/data": self.data_snapshot,
+            b"/relays": self.relays_snapshot,
+        }
+        self._data = (None, None)  # (data version, response)
+        self._relays = (None, None)  # (relay states, response)
+        self.requests = 0
+        self.buf = bytearray(CNFG.METRICS_BUFFER)
+
+    def data_snapshot(self) -> bytes:
+        if self._data[0] != self.data.version:
+            ds18 = {}
+            for addr, value in self.data.ds18.items():
+                ds18[hexlify(addr).decode()] = value
+            self._data = (
+                self.data.version,
+                response(
+                    {
+                        "ds18": ds18,
+                        "sht": self.data.sht,
+                        "bh1750": self.data.bh1750,
+                        "ads": self.data.ads,
+                        "ads_avg": self.data.ads_avg,
+                    }
+                ),
+            )
+        return self._data[1]
+
+    def relays_snapshot(self) -> bytes:
+        states = tuple(
+            self.hw[name].enabled if self.hw.get(name) else None for name in CNFG.RELAY
+        )
+        if self._relays[0] != states:
+            self._relays = (states, response(dict(zip(CNFG.RELAY, states))))
+        return self._relays[1]
+
+    async def send_metrics(self, writer):
+        """copy rendered lines into the buffer, send it whenever it fills up"""
+        writer.write(METRICS_HEADER)
+        buf = self.buf
+        mv = memoryview(buf)
+        pos = 0
+        for line in metrics.render(self.hw, self.data):
+            line = line.encode()
+            if pos + len(line) > len(buf):
+                writer.write(mv[:pos])
+                await writer.drain()
+                pos = 0
+            buf[pos : pos + len(line)] = line
+            pos += len(line)
+        writer.write(mv[:pos])
+        await writer.drain()
+
+    async def read_request(self, reader):
+        """request line, the headers are drained as none of them matter here"""
+        line = await reader.readline()
+        while True:
+            header = await reader.readline()
+            if not header or header == b"\r\n":
+                return line
+
+    async def handle(self, reader, writer):
+        try:
+            # a stalled client must not keep its socket and buffers forever
+            line = await uasyncio.wait_for_ms(
+                self.read_request(reader), CNFG.HTTP_TIMEOUT * 1000
+            )
+            try:
+                path = line.split(None, 2)[1]
+            except IndexError:
+                path = None
+            if path == b"/metrics":
+                await self.send_metrics(writer)
+            else:
+                route = self.routes.get(path)
+                writer.write(route() if route else NOT_FOUND)
+                await writer.drain()
+            self.requests += 1
+        except uasyncio.TimeoutError:
+            logger.debug("HTTP API client timed out")
+        except OSError as exc:
+            logger.debug(f"HTTP API client dropped. {exc}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def serve(self):
+        logger.info(f"HTTP API listening on port {CNFG.HTTP_API_PORT}")
+        await uasyncio.start_server(self.handle, "0.0.0.0", CNFG.HTTP_API_PORT)
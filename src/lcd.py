@@ -1,7 +1,28 @@
+import gc
 import time
 import network
+from collections import namedtuple
+
+import uasyncio
 
 import config as CNFG
+from lib.bitfont import BitmapFont
+import metrics
+import log_setup
+
+logger = log_setup.getLogger("lcd")
+
+CHART_TOP = 10  # first pixel row below the chart title
+LCD_ROWS = 6  # text lines as laid out by longtext
+LINE_H = 10  # longtext line pitch in pixels
+
+# slide priorities
+LOW = 0  # skipped while their content does not change
+NORMAL = 1
+ALERT = 2  # shown between the other slides while active
+CRITICAL = 3
+
+_font = None
 
 
 def align_to(msg, limit=CNFG.LCD_MAX_CHAR):
@@ -20,73 +41,253 @@ def parse(msgs: list) -> str:
     return "".join(map(align_to, msgs))
 
 
-def ds18_and_light(ds18, bh) -> str:
-    msgs = []
-    for id, value in ds18.items():
-        id = hex(id[-1]).replace("0x", "\\")
-        msgs.append(f"DS{id}: {value:.4} C")
-    msgs.append(newline())
-    msgs.append(f"Light: {bh:>.4} lm")
-    return parse(msgs)
+class TextBuffer:
+    """preallocated characters of one slide
 
+    slide builders write into it with the put_* routines, numbers are
+    formatted in place, so rendering the text does not allocate.
+    Graphics drawn over it (readouts, charts) still may"""
+
+    def __init__(self, cols=CNFG.LCD_MAX_CHAR, rows=LCD_ROWS):
+        self.cols = cols
+        self.chars = bytearray(cols * rows)
+        self.clear()
+
+    def clear(self):
+        chars = self.chars
+        for i in range(len(chars)):
+            chars[i] = 32
+
+    def put(self, row, col, text) -> int:
+        """text clipped at the end of the row, returns the column after it"""
+        chars = self.chars
+        pos = row * self.cols + col
+        count = min(len(text), self.cols - col)
+        for i in range(count):
+            chars[pos + i] = ord(text[i])
+        return col + count
+
+    def put_int(self, row, col, value, width, fill=32) -> int:
+        """right aligned in width columns, "#" filled if it does not fit"""
+        chars = self.chars
+        start = row * self.cols + col
+        pos = start + width - 1
+        negative = value < 0
+        if negative:
+            value = -value
+        while pos >= start:
+            chars[pos] = 48 + value % 10
+            value //= 10
+            pos -= 1
+            if not value:
+                break
+        if negative and pos >= start:
+            chars[pos] = 45
+            pos -= 1
+        elif negative or value:
+            for i in range(start, start + width):
+                chars[i] = 35
+        while pos >= start:
+            chars[pos] = fill
+            pos -= 1
+        return col + width
+
+    def put_fixed(self, row, col, value, width, decimals=1) -> int:
+        """float rounded to decimals (>= 1), right aligned in width columns"""
+        scale = 10**decimals
+        # the only boxed float temporary, the rest is small int math
+        tenths = int(value * (scale * 10))
+        negative = tenths < 0
+        if negative:
+            tenths = -tenths
+        scaled = (tenths + 5) // 10
+        whole = width - decimals - 1
+        if digits(scaled // scale) + negative > whole:
+            chars = self.chars
+            start = row * self.cols + col
+            for i in range(start, start + width):
+                chars[i] = 35  # "#", does not fit
+            return col + width
+        self.put_int(row, col + whole + 1, scaled % scale, decimals, 48)
+        self.chars[row * self.cols + col + whole] = 46
+        self.put_int(row, col, scaled // scale, whole)
+        if negative:
+            # sign in front of the first digit
+            self.chars[row * self.cols + col + whole - digits(scaled // scale) - 1] = 45
+        return col + width
+
+    def put_wrapped(self, row, text):
+        """text continued on the next rows instead of clipped"""
+        chars = self.chars
+        pos = row * self.cols
+        for i in range(min(len(text), len(chars) - pos)):
+            chars[pos + i] = ord(text[i])
+
+    def put_hex(self, row, col, value, width=2) -> int:
+        chars = self.chars
+        pos = row * self.cols + col + width - 1
+        for _ in range(width):
+            nibble = value & 0xF
+            chars[pos] = 48 + nibble if nibble < 10 else 87 + nibble
+            value >>= 4
+            pos -= 1
+        return col + width
+
+
+def digits(value) -> int:
+    count = 1
+    while value >= 10:
+        value //= 10
+        count += 1
+    return count
+
+
+def ds18_and_light(text, ds18, bh):
+    row = 0
+    for addr in ds18:
+        text.put(row, 0, "DS\\")
+        text.put_hex(row, 3, addr[-1])
+        text.put(row, 5, ":")
+        text.put_fixed(row, 6, ds18[addr], 6, 2)
+        text.put(row, 13, "C")
+        row += 1
+    row += 1
+    text.put(row, 0, "Light:")
+    text.put_int(row, 7, bh, 6)
+    text.put(row, 14, "lm")
 
-def sht(data) -> str:
-    msgs = ["Atmsphr data"]
-    msgs.append(newline())
-    msgs.append(newline())
-    msgs.append(f"Temp: {data['cels']:.4} C")
-    msgs.append(newline())
-    msgs.append(f"Humi: {data['hum']:.4} %")
-    return parse(msgs)
 
+def big_font():
+    """large digit font, loaded on first use; None when the font file is missing"""
+    global _font
+    if _font is None:
+        try:
+            _font = BitmapFont(CNFG.LCD_FONT, CNFG.LCD_FONT_CACHE)
+        except OSError:
+            _font = False
+    return _font or None
 
-def network_status(sta_if) -> str:
+
+def readout(display, value, unit, y):
+    """large value with a small unit behind it, 24 px tall"""
+    font = big_font()
+    if font is None:
+        display.text(f"{value} {unit}", 0, y + 8)
+        return
+    x = font.text(display.framebuf, value, 0, y)
+    display.text(unit, x + 2, y + font.height - 8)
+
+
+def sht_large(display, data):
+    readout(display, f"{data['cels']:.1f}", "C", 12)
+    readout(display, f"{data['hum']:.1f}", "%RH", 38)
+
+
+def network_status(text, sta_if):
     # get network and ntp data
-    msgs = []
     if not sta_if.isconnected():
-        msgs.append("Status: Offline")
-        return parse(msgs)
-    msgs.append("Status: Connectd")
-    msgs.append("IP addr:")
-    msgs.append(sta_if.ifconfig()[0])
-    msgs.append(newline())
-    dt = [f"{dt:02}" for dt in time.localtime()]  # zero padding +str for time and date
-    msgs.append("-".join(dt[0:3]))  # date
-    msgs.append(":".join(dt[3:6]))  # time
-    return parse(msgs)
+        text.put(0, 0, "Status: Offline")
+        return
+    text.put(0, 0, "Status: Connectd")
+    text.put(1, 0, "IP addr:")
+    text.put(2, 0, sta_if.ifconfig()[0])
+    dt = time.localtime()
+    text.put_int(4, 0, dt[0], 4)  # date
+    text.put(4, 4, "-")
+    text.put_int(4, 5, dt[1], 2, 48)
+    text.put(4, 7, "-")
+    text.put_int(4, 8, dt[2], 2, 48)
+    text.put_int(5, 0, dt[3], 2, 48)  # time
+    text.put(5, 2, ":")
+    text.put_int(5, 3, dt[4], 2, 48)
+    text.put(5, 5, ":")
+    text.put_int(5, 6, dt[5], 2, 48)
 
 
-def network_error(lcd, gfx):
-    """clear top half of the display and show the banner there"""
-    gfx.fill_rect(0, 0, 128, 32, 0)
-    lcd.show()
-    lcd.longtext(CNFG.MSG_LCD["offline"], CNFG.LCD_MAX_CHAR, clear=False)
+def network_error(text):
+    text.put_wrapped(1, CNFG.MSG_LCD["offline"])
 
 
-def soil_humidity(data):
-    msgs = ["Soil humidity"]
-    msgs.append(newline())
-    msgs.append(f"0: {data.ads[0]:>3}%   AVRGE:")
-    msgs.append(f"1: {data.ads[1]:>3}%   {data.ads_avg:>3} %")
-    msgs.append(f"2: {data.ads[2]:>3}%   TRIGG:")
-    msgs.append(f"3: {data.ads[3]:>3}%   {CNFG.TRG_SOIL:>3} %")
-
-    # for channel in range(CNFG.ADS_CHANNELS):
-    #     val = f"{data.ads[channel]}"
-    #     msgs.append(f"{channel}: {val:>8} %")
-    # msgs.append(f"AVG: {data.ads_avg}% | TRIG: {CNFG.TRG_SOIL} %")
-    return parse(msgs)
+def low_water(text):
+    text.put(1, 0, "!!!!!!!!!!!!!!!!")
+    text.put(2, 0, "!! LOW  WATER !!")
+    text.put(3, 0, "!!!!!!!!!!!!!!!!")
+    text.put(5, 0, "Pump disabled")
 
 
-def relay_states(relay):
-    msgs = ["Relay"]
-    msgs.append(newline())
-    # find len of max. string
-    for name, pin in relay.items():
-        state = "OFF" if pin.value() == 1 else "ON"
-        name = name if len(name) < 10 else name[:10]
-        msgs.append(f"{state:3} - {name}")
-    return parse(msgs)
+def pump_running_s(pump) -> int:
+    if pump is None or pump.on_since is None:
+        return 0
+    return time.ticks_diff(time.ticks_ms(), pump.on_since) // 1000
+
+
+def pump_fault(text, pump):
+    text.put(1, 0, "!!!!!!!!!!!!!!!!")
+    text.put(2, 0, "!! PUMP FAULT !!")
+    text.put(3, 0, "!!!!!!!!!!!!!!!!")
+    text.put(5, 0, "Running")
+    text.put_int(5, 8, pump_running_s(pump) // 60, 4)
+    text.put(5, 13, "min")
+
+
+def soil_humidity(text, data):
+    text.put(0, 0, "Soil humidity")
+    for channel in range(CNFG.ADS_CHANNELS):
+        row = channel + 2
+        text.put_int(row, 0, channel, 1)
+        text.put(row, 1, ":")
+        text.put_int(row, 3, data.ads[channel], 3)
+        text.put(row, 6, "%")
+    text.put(2, 10, "AVRGE:")
+    text.put_int(3, 10, int(data.ads_avg), 3)
+    text.put(3, 14, "%")
+    text.put(4, 10, "TRIGG:")
+    text.put_int(5, 10, CNFG.TRG_SOIL, 3)
+    text.put(5, 14, "%")
+
+
+def chart_title(text, title, history, unit):
+    text.put(0, 0, title)
+    col = text.cols - len(unit)
+    text.put(0, col, unit)
+    col -= digits(history.hi)
+    text.put_int(0, col, history.hi, digits(history.hi))
+    col -= 1
+    text.put(0, col, "-")
+    col -= digits(history.lo)
+    text.put_int(0, col, history.lo, digits(history.lo))
+
+
+def chart(display, history):
+    """one vline per sample, newest on the right, scaled to the min-max range"""
+    start = time.ticks_us()
+    vline = display.framebuf.vline
+    samples, size = history.samples, history.size
+    lo = history.lo
+    span = max(history.hi - lo, 1)
+    height = CNFG.LCD_H - CHART_TOP
+    x = CNFG.LCD_W - history.count
+    i = (history.head - history.count) % size
+    for _ in range(history.count):
+        h = (samples[i] - lo) * (height - 1) // span + 1
+        vline(x, CNFG.LCD_H - h, h, 1)
+        x += 1
+        i += 1
+        if i == size:
+            i = 0
+    metrics.set_gauge(
+        "lcd_chart_render_seconds", time.ticks_diff(time.ticks_us(), start) / 1000000
+    )
+
+
+def relay_states(text, relay):
+    text.put(0, 0, "Relay")
+    row = 2
+    for name in relay:
+        text.put(row, 0, "OFF" if relay[name].value() == 1 else "ON")
+        text.put(row, 4, "-")
+        text.put(row, 6, name)  # clipped to 10 chars
+        row += 1
 
 
 def autostart_aborted():
@@ -96,3 +297,488 @@ def autostart_aborted():
     msgs.append(align_to_center("ABORTED"))
     msgs.append(newline())
     return parse(msgs)
+
+
+Slide = namedtuple(
+    "Slide", ["name", "ready", "key", "render", "draw", "priority", "duration"]
+)
+
+# ready: slide has data to show
+# key: the slide inputs, the cached frame is valid while it does not change
+#   evaluated every tick, so prefer data.version over building tuples
+# render: writes the slide text into a TextBuffer
+# draw: graphics drawn over the text, optional
+# priority: LOW .. CRITICAL, ALERT and up preempt the rotation while ready
+# duration: seconds on the display
+SLIDES = (
+    Slide(
+        "network",
+        lambda hw, data: True,
+        lambda hw, data: (hw["wifi"].sta_if.isconnected(), time.localtime()[:6]),
+        lambda hw, data, text: network_status(text, hw["wifi"].sta_if),
+        None,
+        NORMAL,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "ds18_light",
+        lambda hw, data: data.ds18 and data.bh1750,
+        lambda hw, data: data.version,
+        lambda hw, data, text: ds18_and_light(text, data.ds18, data.bh1750),
+        None,
+        NORMAL,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "sht",
+        lambda hw, data: data.sht,
+        lambda hw, data: data.version,
+        lambda hw, data, text: text.put(0, 0, "Atmsphr data"),
+        lambda display, hw, data: sht_large(display, data.sht),
+        NORMAL,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "soil",
+        lambda hw, data: data.ads,
+        # the trigger (0..100) is set from the cloud, packed in with the version
+        lambda hw, data: data.version << 7 | CNFG.TRG_SOIL,
+        lambda hw, data, text: soil_humidity(text, data),
+        None,
+        NORMAL,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "soil_chart",
+        lambda hw, data: data.history["soil"].count > 1,
+        lambda hw, data: data.history["soil"].version,
+        lambda hw, data, text: chart_title(text, "Soil", data.history["soil"], "%"),
+        lambda display, hw, data: chart(display, data.history["soil"]),
+        LOW,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "hum_chart",
+        lambda hw, data: data.history["hum"].count > 1,
+        lambda hw, data: data.history["hum"].version,
+        lambda hw, data, text: chart_title(text, "Humi", data.history["hum"], "%"),
+        lambda display, hw, data: chart(display, data.history["hum"]),
+        LOW,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "light_chart",
+        lambda hw, data: data.history["light"].count > 1,
+        lambda hw, data: data.history["light"].version,
+        lambda hw, data, text: chart_title(text, "Light", data.history["light"], ""),
+        lambda display, hw, data: chart(display, data.history["light"]),
+        LOW,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "relay",
+        lambda hw, data: hw["relay"],
+        lambda hw, data: tuple(pin.value() for pin in hw["relay"].values()),
+        lambda hw, data, text: relay_states(text, hw["relay"]),
+        None,
+        LOW,
+        CNFG.T_LCD_FRAME,
+    ),
+    Slide(
+        "offline",
+        lambda hw, data: not hw["wifi"].is_up(),
+        lambda hw, data: None,
+        lambda hw, data, text: network_error(text),
+        None,
+        ALERT,
+        CNFG.T_LCD_ALERT,
+    ),
+    Slide(
+        "low_water",
+        lambda hw, data: hw[CNFG.R_ID_PUMP] and hw[CNFG.R_ID_PUMP].low_level(),
+        lambda hw, data: None,
+        lambda hw, data, text: low_water(text),
+        None,
+        CRITICAL,
+        CNFG.T_LCD_ALERT,
+    ),
+    Slide(
+        "pump_fault",
+        lambda hw, data: pump_running_s(hw[CNFG.R_ID_PUMP]) >= CNFG.PUMP_MAX_RUN,
+        lambda hw, data: pump_running_s(hw[CNFG.R_ID_PUMP]) // 60,
+        lambda hw, data, text: pump_fault(text, hw[CNFG.R_ID_PUMP]),
+        None,
+        CRITICAL,
+        CNFG.T_LCD_ALERT,
+    ),
+)
+
+
+class TextGrid:
+    """16x6 characters laid out like longtext
+
+    valid while the framebuffer holds nothing but the grid text,
+    update() then redraws only the cells that differ from the new text"""
+
+    def __init__(self, display, cols=CNFG.LCD_MAX_CHAR, rows=LCD_ROWS):
+        self.display = display
+        self.cols = cols
+        self.cells = bytearray(cols * rows)
+        self.valid = False
+
+    def update(self, chars) -> int:
+        """draw the TextBuffer chars over the grid, returns the number of redrawn cells"""
+        fb = self.display.framebuf
+        cells = self.cells
+        if not self.valid:
+            fb.fill(0)
+            for i in range(len(cells)):
+                cells[i] = 32
+            self.valid = True
+        changed = 0
+        for i in range(len(cells)):
+            char = chars[i]
+            if char > 126:
+                char = 63  # "?", the framebuf font is ASCII only
+            if cells[i] != char:
+                x = (i % self.cols) * 8
+                y = (i // self.cols) * LINE_H
+                fb.fill_rect(x, y, 8, 8, 0)
+                fb.text(chr(char), x, y, 1)
+                cells[i] = char
+                changed += 1
+        return changed
+
+
+class SlideCache:
+    """rendered framebuffer per slide
+
+    a slide is re-rendered only when its key changes,
+    otherwise showing it is a buffer copy plus a flush, which
+    yields to other coroutines while the I2C transfer runs.
+    Text-only slides re-render through the TextGrid, so a ticking
+    clock redraws and flushes just the changed characters"""
+
+    def __init__(self):
+        # name -> (key, framebuffer copy, grid cells copy, grid valid)
+        self.frames = {}
+        self.grid = None
+        self.text = TextBuffer()
+        self.shown = None  # (name, key) on the display right now
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """something else drew on the display"""
+        self.shown = None
+        if self.grid:
+            self.grid.valid = False
+
+    async def show(self, display, slide, hw, data):
+        key = slide.key(hw, data)
+        shown = self.shown
+        # compared field by field, runs every tick of the shown slide
+        if shown and shown[0] == slide.name and shown[1] == key:
+            return
+        if self.grid is None:
+            self.grid = TextGrid(display)
+        grid = self.grid
+        entry = self.frames.get(slide.name)
+        if entry and entry[0] == key:
+            display.fbdata[:] = entry[1]
+            grid.cells[:] = entry[2]
+            grid.valid = entry[3]
+            self.hits += 1
+        else:
+            if slide.draw:
+                grid.valid = False
+            self.text.clear()
+            slide.render(hw, data, self.text)
+            grid.update(self.text.chars)
+            if slide.draw:
+                slide.draw(display, hw, data)
+                grid.valid = False
+            if entry:
+                frame, text = entry[1], entry[2]
+            else:
+                frame, text = bytearray(len(display.fbdata)), bytearray(len(grid.cells))
+            frame[:] = display.fbdata
+            text[:] = grid.cells
+            self.frames[slide.name] = (key, frame, text, grid.valid)
+            self.misses += 1
+        self.shown = (slide.name, key)
+        await display.show_async()
+
+
+def minute_of_day(hhmm) -> int:
+    hour, minute = map(int, hhmm.split(":"))
+    return hour * 60 + minute
+
+
+class DisplayPower:
+    """scheduled dim and off periods of the OLED against burn-in and bus load
+
+    wake() keeps the display at full contrast for LCD_WAKE_TIME,
+    update() applies the mode and is called before each slide"""
+
+    def __init__(self, display):
+        self.display = display
+        self.mode = "on"
+        self.woken = None  # ticks_ms of the last wake()
+        self.schedule = [
+            (minute_of_day(start), minute_of_day(end), mode)
+            for start, end, mode in CNFG.LCD_SCHEDULE
+        ]
+        self.hour_start = time.ticks_ms()
+        self.hour_sent = display.total_sent
+
+    def wake(self):
+        self.woken = time.ticks_ms()
+
+    def scheduled(self) -> str:
+        now = time.localtime()
+        if now[0] == 2000:  # RTC not synced, the schedule means nothing yet
+            return "on"
+        minute = now[3] * 60 + now[4]
+        for start, end, mode in self.schedule:
+            if start <= end:
+                inside = start <= minute < end
+            else:
+                inside = minute >= start or minute < end
+            if inside:
+                return mode
+        return "on"
+
+    def update(self) -> str:
+        mode = self.scheduled()
+        if self.woken is not None:
+            if time.ticks_diff(time.ticks_ms(), self.woken) < CNFG.LCD_WAKE_TIME * 1000:
+                mode = "on"
+            else:
+                self.woken = None
+        if mode != self.mode:
+            logger.info(f"Display {mode}")
+            if mode == "off":
+                self.display.poweroff()
+            else:
+                if self.mode == "off":
+                    self.display.poweron()
+                self.display.contrast(
+                    CNFG.LCD_CONTRAST_DIM if mode == "dim" else CNFG.LCD_CONTRAST
+                )
+            self.mode = mode
+        self.account()
+        return mode
+
+    def account(self):
+        """report the display bytes sent over the last full hour"""
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.hour_start) >= 3600000:
+            sent = self.display.total_sent - self.hour_sent
+            metrics.set_gauge("lcd_bytes_per_hour", sent)
+            logger.info(f"LCD sent {sent} bytes in the last hour")
+            self.hour_start = now
+            self.hour_sent = self.display.total_sent
+
+
+class SlideScheduler:
+    """decides which slide is on the display and for how long
+
+    slides rotate in SLIDES order for their duration; LOW ones are skipped
+    while their key did not change since they were last shown.
+    An alert (priority ALERT and up) preempts the current slide as soon as
+    it becomes ready and is then shown between the other slides until it
+    clears. notify() wakes the scheduler, it is safe to call from an IRQ.
+
+    CRITICAL alerts and button() wake a dimmed or switched off display.
+    The live refresh tick backs off while the slide does not change and
+    slides stay LCD_DIM_STRETCH times longer while dimmed"""
+
+    def __init__(self, hw, data, slides=SLIDES):
+        self.hw = hw
+        self.data = data
+        self.slides = slides
+        self.cache = SlideCache()
+        self.wake = uasyncio.ThreadSafeFlag()
+        self.index = -1  # rotation position
+        self.seen = {}  # name -> key when the slide was last shown
+        self.raised = set()  # names of ready alerts which were shown already
+        self.current = None
+        self.power = None  # DisplayPower, created with the display in run()
+
+    def notify(self, *args):
+        self.wake.set()
+
+    def button(self, pin):
+        if self.power:
+            self.power.wake()
+        self.wake.set()
+
+    def fresh_alert(self):
+        """highest ready alert that was not shown since it became ready"""
+        fresh = None
+        for slide in self.slides:
+            if slide.priority < ALERT:
+                continue
+            if not slide.ready(self.hw, self.data):
+                self.raised.discard(slide.name)
+            elif slide.name not in self.raised:
+                if fresh is None or slide.priority > fresh.priority:
+                    fresh = slide
+        return fresh
+
+    def active_alert(self):
+        best = None
+        for slide in self.slides:
+            if slide.priority >= ALERT and slide.ready(self.hw, self.data):
+                if best is None or slide.priority > best.priority:
+                    best = slide
+        return best
+
+    def next_slide(self):
+        """next slide of the rotation, None when all are skipped"""
+        for _ in range(len(self.slides)):
+            self.index = (self.index + 1) % len(self.slides)
+            slide = self.slides[self.index]
+            if slide.priority >= ALERT or not slide.ready(self.hw, self.data):
+                continue
+            if slide.priority == LOW and self.seen.get(slide.name) == slide.key(
+                self.hw, self.data
+            ):
+                continue
+            return slide
+        return None
+
+    def pick(self):
+        alert = self.fresh_alert()
+        if alert:
+            self.raised.add(alert.name)
+            if alert.priority == CRITICAL and self.power:
+                self.power.wake()
+            return alert
+        if self.current is None or self.current.priority < ALERT:
+            # active alerts take every other slot
+            alert = self.active_alert()
+            if alert:
+                return alert
+        return self.next_slide() or self.current
+
+    def preempted(self, slide) -> bool:
+        if slide.priority >= ALERT and not slide.ready(self.hw, self.data):
+            return True  # the alert cleared
+        alert = self.fresh_alert()
+        return alert is not None and alert.priority >= slide.priority
+
+    async def wait(self, ms) -> bool:
+        """sleep up to ms, True when woken up by notify()"""
+        try:
+            await uasyncio.wait_for_ms(self.wake.wait(), ms)
+            return True
+        except uasyncio.TimeoutError:
+            return False
+
+    async def run(self, display):
+        if display is None:
+            # SSD1306 absent or failed to init, the rest of the box runs without it
+            logger.warn("No display, slides disabled")
+            return
+        self.power = DisplayPower(display)
+        while True:
+            try:
+                mode = self.power.update()
+                if mode == "off":
+                    alert = self.fresh_alert()
+                    if alert is None or alert.priority < CRITICAL:
+                        # the schedule is re-checked every minute, IRQs wake earlier
+                        await self.wait(60000)
+                        continue
+                slide = self.pick()
+                if slide is None:
+                    await self.wait(CNFG.T_LCD_FRAME * 1000)
+                    continue
+                # pick() may have woken the display for an alert
+                await self.present(display, slide, self.power.update())
+            except (OSError, AttributeError):
+                logger.error("Failed to display LCD text")
+                await uasyncio.sleep(CNFG.T_LCD_FRAME)
+
+    async def present(self, display, slide, mode):
+        """show the slide for its duration, refreshing live fields in place"""
+        self.current = slide
+        logger.debug("LCD slide: %s", slide.name, fmt=True)
+        duration = slide.duration * 1000
+        if mode == "dim":
+            duration *= CNFG.LCD_DIM_STRETCH
+        deadline = time.ticks_add(time.ticks_ms(), duration)
+        self.seen[slide.name] = slide.key(self.hw, self.data)
+        await self.cache.show(display, slide, self.hw, self.data)
+        tick = 1000
+        while True:
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                break
+            await self.wait(min(remaining, tick))
+            if self.preempted(slide):
+                break
+            shown = self.cache.shown
+            await self.cache.show(display, slide, self.hw, self.data)
+            # nothing changed - check less often, up to once per slide
+            tick = 1000 if self.cache.shown != shown else min(tick * 2, duration)
+
+
+def benchmark_gfx(gfx, ops=200) -> dict:
+    """draw ops per second of the GFX primitives, run from REPL:
+    lcd.benchmark_gfx(master.hw["gfx"])"""
+    result = {}
+    for name, draw in (
+        ("pixel", lambda i: gfx._pixel(i % CNFG.LCD_W, i % CNFG.LCD_H, 1)),
+        ("hline", lambda i: gfx.hline(0, i % CNFG.LCD_H, CNFG.LCD_W, 1)),
+        ("vline", lambda i: gfx.vline(i % CNFG.LCD_W, 0, CNFG.LCD_H, 1)),
+        ("line", lambda i: gfx.line(0, 0, CNFG.LCD_W - 1, i % CNFG.LCD_H, 1)),
+        ("rect", lambda i: gfx.rect(0, 0, CNFG.LCD_W, CNFG.LCD_H, 1)),
+        ("fill_rect", lambda i: gfx.fill_rect(0, 0, CNFG.LCD_W, 32, i & 1)),
+    ):
+        start = time.ticks_us()
+        for i in range(ops):
+            draw(i)
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        result[name] = ops * 1000000 // max(elapsed, 1)
+    return result
+
+
+def benchmark_chart(display, runs=20) -> int:
+    """microseconds to draw a full width chart, run from REPL:
+    lcd.benchmark_chart(master.hw["lcd"])"""
+    from datastore import History
+
+    history = History()
+    for i in range(history.size):
+        history.append((i * 37) % 100)
+    start = time.ticks_us()
+    for _ in range(runs):
+        display.fill(0)
+        chart(display, history)
+    return time.ticks_diff(time.ticks_us(), start) // runs
+
+
+def measure_render(hw, data, display=None) -> dict:
+    """bytes allocated by the key, render and draw of each ready slide, run from REPL:
+    lcd.measure_render(master.hw, master.data)
+
+    the display is drawn on but not flushed, its content is restored after"""
+    display = display or hw["lcd"]
+    saved = bytearray(display.fbdata)
+    text = TextBuffer()
+    result = {}
+    for slide in SLIDES:
+        if not slide.ready(hw, data):
+            continue
+        text.clear()
+        before = gc.mem_alloc()
+        slide.key(hw, data)
+        slide.render(hw, data, text)
+        if slide.draw:
+            slide.draw(display, hw, data)
+        result[slide.name] = gc.mem_alloc() - before
+    display.fbdata[:] = saved
+    return result
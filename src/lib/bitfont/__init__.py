@@ -0,0 +1,60 @@
+# Packed bitmap font for framebuf based displays.
+#
+# The font file holds a 4 byte header (glyph width, height, first char code,
+# glyph count) followed by the glyphs in framebuf.MONO_VLSB order, which is
+# the SSD1306 memory layout, so blitting a glyph is a plain byte copy.
+# Glyphs are read from flash on first use and the most recently used ones
+# are kept in RAM. See fontgen.py in the repository root.
+
+import framebuf
+
+HEADER_SIZE = 4
+
+
+class BitmapFont:
+    def __init__(self, path, cache_size=12):
+        self.file = open(path, "rb")
+        self.width, self.height, self.first, self.count = self.file.read(HEADER_SIZE)
+        self.glyph_size = self.width * ((self.height + 7) // 8)
+        self.cache_size = cache_size
+        self.cache = {}  # char code -> (buffer, FrameBuffer)
+        self.order = []  # char codes, least recently used first
+        self.loads = 0
+
+    def glyph(self, char):
+        """FrameBuffer of the char, None when the font does not have it"""
+        code = ord(char)
+        entry = self.cache.get(code)
+        if entry:
+            if self.order[-1] != code:
+                self.order.remove(code)
+                self.order.append(code)
+            return entry[1]
+
+        index = code - self.first
+        if not 0 <= index < self.count:
+            return None
+        if len(self.order) >= self.cache_size:
+            # reuse the evicted buffer, no allocation once the cache is full
+            buf, fb = self.cache.pop(self.order.pop(0))
+        else:
+            buf = bytearray(self.glyph_size)
+            fb = framebuf.FrameBuffer(buf, self.width, self.height, framebuf.MONO_VLSB)
+        self.file.seek(HEADER_SIZE + index * self.glyph_size)
+        self.file.readinto(buf)
+        self.cache[code] = (buf, fb)
+        self.order.append(code)
+        self.loads += 1
+        return fb
+
+    def text(self, target, string, x, y) -> int:
+        """blit the string into the target FrameBuffer, returns x after the last glyph"""
+        for char in string:
+            fb = self.glyph(char)
+            if fb is not None:
+                target.blit(fb, x, y)
+            x += self.width
+        return x
+
+    def close(self):
+        self.file.close()
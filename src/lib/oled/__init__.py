@@ -7,7 +7,9 @@
 
 
 class GFX:
-    def __init__(self, width, height, pixel, hline=None, vline=None):
+    def __init__(
+        self, width, height, pixel, hline=None, vline=None, fill_rect=None, line=None
+    ):
         # Create an instance of the GFX drawing class.  You must pass in the
         # following parameters:
         #  - width = The width of the drawing area in pixels.
@@ -23,6 +25,8 @@ class GFX:
         #  - vline = A function to quickly draw a vertical line on the display.
         #            This should take at least an x, y, and height paraemter and
         #            any number of optional color or other parameters.
+        #  - fill_rect, line = native implementations (i.e. framebuf methods)
+        #            with the same signature, replacing the Python ones.
         self.width = width
         self.height = height
         self._pixel = pixel
@@ -36,6 +40,10 @@ class GFX:
             self.vline = self._slow_vline
         else:
             self.vline = vline
+        if fill_rect is not None:
+            self.fill_rect = fill_rect
+        if line is not None:
+            self.line = line
 
     def _slow_hline(self, x0, y0, width, *args, **kwargs):
         # Slow implementation of a horizontal line using pixel drawing.
@@ -78,6 +86,8 @@ class GFX:
     def line(self, x0, y0, x1, y1, *args, **kwargs):
         # Line drawing function.  Will draw a single pixel wide line starting at
         # x0, y0 and ending at x1, y1.
+        # Bresenham emitting runs instead of pixels: the pixels between two
+        # steps of the minor axis are drawn by a single hline/vline call.
         steep = abs(y1 - y0) > abs(x1 - x0)
         if steep:
             x0, y0 = y0, x0
@@ -93,15 +103,18 @@ class GFX:
             ystep = 1
         else:
             ystep = -1
+        run = x0
         while x0 <= x1:
-            if steep:
-                self._pixel(y0, x0, *args, **kwargs)
-            else:
-                self._pixel(x0, y0, *args, **kwargs)
             err -= dy
-            if err < 0:
-                y0 += ystep
-                err += dx
+            if err < 0 or x0 == x1:
+                if steep:
+                    self.vline(y0, run, x0 - run + 1, *args, **kwargs)
+                else:
+                    self.hline(run, y0, x0 - run + 1, *args, **kwargs)
+                run = x0 + 1
+                if err < 0:
+                    y0 += ystep
+                    err += dx
             x0 += 1
 
     # def circle(self, x0, y0, radius, *args, **kwargs):
@@ -3,6 +3,7 @@
 
 import time
 import framebuf
+import uasyncio
 
 # register definitions
 SET_CONTRAST = const(0x81)
@@ -30,6 +31,16 @@ class SSD1306:
         self.height = height
         self.external_vcc = external_vcc
         self.pages = self.height // 8
+        # copy of what the display RAM holds, show() sends only what differs
+        self.shadow = bytearray(self.pages * self.width)
+        self.synced = False  # shadow not valid until the first full flush
+        # bumped by every flush, an async flush stops once it is outdated
+        self.frame = 0
+        # data bytes of the last flush and totals since init
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.total_sent = 0
+        self.total_saved = 0
         # Note the subclass must initialize self.framebuf to a framebuffer.
         # This is necessary because the underlying data buffer is different
         # between I2C and SPI implementations (I2C needs an extra byte).
@@ -83,20 +94,121 @@ class SSD1306:
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
+    def set_window(self, col0, col1, page0, page1):
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
-            x0 += 32
-            x1 += 32
+            col0 += 32
+            col1 += 32
         self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
+        self.write_cmd(col0)
+        self.write_cmd(col1)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_framebuf()
+        self.write_cmd(page0)
+        self.write_cmd(page1)
+
+    def dirty_columns(self, page):
+        """(first, last) column of the page changed since the last flush"""
+        start = page * self.width
+        end = start + self.width
+        cur = self.fbdata
+        old = self.shadow
+        # index loops instead of slice compares, runs on every page of every frame
+        # and must not allocate
+        c0 = start
+        while c0 < end and cur[c0] == old[c0]:
+            c0 += 1
+        if c0 == end:
+            return None
+        c1 = end - 1
+        while cur[c1] == old[c1]:
+            c1 -= 1
+        return c0 - start, c1 - start
+
+    def show(self, full=False):
+        """flush only the changed windows; `full` resends the whole frame"""
+        self.frame += 1
+        size = self.pages * self.width
+        if full or not self.synced:
+            self.set_window(0, self.width - 1, 0, self.pages - 1)
+            self.write_framebuf()
+            self.shadow[:] = self.fbdata
+            self.synced = True
+            self.bytes_sent = size
+        else:
+            self.bytes_sent = 0
+            page = 0
+            while page < self.pages:
+                cols = self.dirty_columns(page)
+                if cols is None:
+                    page += 1
+                    continue
+                # merge following dirty pages into one window
+                c0, c1 = cols
+                last = page
+                while last + 1 < self.pages:
+                    cols = self.dirty_columns(last + 1)
+                    if cols is None:
+                        break
+                    c0, c1 = min(c0, cols[0]), max(c1, cols[1])
+                    last += 1
+                self.flush_window(c0, c1, page, last)
+                page = last + 1
+        self.bytes_saved = size - self.bytes_sent
+        self.total_sent += self.bytes_sent
+        self.total_saved += self.bytes_saved
+
+    async def show_async(self, full=False, chunk=16):
+        """show() that yields to the event loop after every `chunk` bytes
+
+        one page window is set at a time and its data sent in chunks,
+        the display keeps the address pointer between transactions.
+        A newer flush cancels this one; what was not sent stays dirty
+        in the shadow and goes out with the newer flush.
+        Returns False if cancelled"""
+        self.frame += 1
+        frame = self.frame
+        full = full or not self.synced
+        size = self.pages * self.width
+        self.bytes_sent = 0
+        done = True
+        for page in range(self.pages):
+            cols = (0, self.width - 1) if full else self.dirty_columns(page)
+            if cols is None:
+                continue
+            self.set_window(cols[0], cols[1], page, page)
+            start = page * self.width
+            for col in range(cols[0], cols[1] + 1, chunk):
+                a = start + col
+                b = start + min(col + chunk, cols[1] + 1)
+                self.write_data([self.fbdata[a:b]])
+                self.shadow[a:b] = self.fbdata[a:b]
+                self.bytes_sent += b - a
+                await uasyncio.sleep_ms(0)
+                if frame != self.frame:
+                    done = False
+                    break
+            if not done:
+                break
+        if done and full:
+            self.synced = True
+        self.bytes_saved = size - self.bytes_sent
+        self.total_sent += self.bytes_sent
+        self.total_saved += self.bytes_saved
+        return done
+
+    def flush_window(self, col0, col1, page0, page1):
+        self.set_window(col0, col1, page0, page1)
+        views = []
+        for page in range(page0, page1 + 1):
+            start = page * self.width
+            views.append(self.fbdata[start + col0 : start + col1 + 1])
+        self.write_data(views)
+        for page in range(page0, page1 + 1):
+            start = page * self.width
+            self.shadow[start + col0 : start + col1 + 1] = self.fbdata[
+                start + col0 : start + col1 + 1
+            ]
+        self.bytes_sent += (col1 - col0 + 1) * (page1 - page0 + 1)
 
     def fill(self, col):
         self.framebuf.fill(col)
@@ -115,7 +227,7 @@ class SSD1306:
         self.framebuf.text(string, x, y, col)
         self.show()
 
-    def longtext(self, message, limit, clear=True):
+    def longtext(self, message, limit, clear=True, show=True):
         y = 0
         chars = 16
         if clear:
@@ -134,13 +246,23 @@ class SSD1306:
                 y += 10  # newline
         else:
             self.text(message, 0, y, 1)
-        self.show()
+        if show:
+            self.show()
 
     def fill_rect(self, x, y, w, h, color):
-        super().fill_rect(x, y, w, h, color)
+        self.framebuf.fill_rect(x, y, w, h, color)
 
     def rect(self, x, y, w, h, color):
-        super().rect(x, y, w, h, color)
+        self.framebuf.rect(x, y, w, h, color)
+
+    def hline(self, x, y, w, color):
+        self.framebuf.hline(x, y, w, color)
+
+    def vline(self, x, y, h, color):
+        self.framebuf.vline(x, y, h, color)
+
+    def line(self, x1, y1, x2, y2, color):
+        self.framebuf.line(x1, y1, x2, y2, color)
 
 
 class SSD1306_I2C(SSD1306):
@@ -155,9 +277,8 @@ class SSD1306_I2C(SSD1306):
         # buffer).
         self.buffer = bytearray(((height // 8) * width) + 1)
         self.buffer[0] = 0x40  # Set first byte of data buffer to Co=0, D/C=1
-        self.framebuf = framebuf.FrameBuffer1(
-            memoryview(self.buffer)[1:], width, height
-        )
+        self.fbdata = memoryview(self.buffer)[1:]
+        self.framebuf = framebuf.FrameBuffer1(self.fbdata, width, height)
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -170,5 +291,10 @@ class SSD1306_I2C(SSD1306):
         # hardware I2C interfaces.
         self.i2c.writeto(self.addr, self.buffer)
 
+    def write_data(self, views):
+        # control byte and the framebuffer slices in one transaction, no copy
+        self.i2c.writevto(self.addr, [b"\x40"] + views)
+
     def poweron(self):
-        pass
+        # display RAM survives poweroff(), switching it on is enough
+        self.write_cmd(SET_DISP | 0x01)
@@ -5,6 +5,11 @@ try:
 except:
     import utime as time
 
+try:
+    import os
+except:
+    import uos as os
+
 try:
     from micropython import const
 except:
@@ -61,6 +66,39 @@ def level_name(level: int, color: bool = False) -> str:
             return "\033[91mCRITICAL\033[0m"
 
 
+class Lazy:
+    """log argument computed only when the record is emitted
+
+    `logger.debug("stats %s", Lazy(breaker.stats), fmt=True)` - other callables
+    (pins, bound methods) are logged as they are, never called"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
+def _resolve(arg):
+    return arg.fn() if isinstance(arg, Lazy) else arg
+
+
+def format_msg(args: tuple, fmt: bool = False) -> str:
+    """
+    Build the message text of a record.
+
+    With `fmt=True` the first arg is %-formatted with the rest,
+    `logger.debug("DS18: %s", data, fmt=True)`, otherwise the args are
+    joined by spaces. Either way the work is done only for emitted records.
+    """
+    if fmt:
+        try:
+            return " " + args[0] % tuple(_resolve(arg) for arg in args[1:])
+        except (TypeError, ValueError):
+            pass  # args not matching the format, still log them joined
+    text = ""
+    for text_ in args:  # 将元组内的文本添加到一起
+        text = "%s %s" % (text, _resolve(text_))  # 防止用户输入其他类型(int, float)
+    return text
+
+
 class BaseClock:
     """
     This is a BaseClock for the logger.
@@ -95,6 +133,8 @@ class Handler:
     _color: bool
     _file_name: str
     _max_size: int
+    _backups: int
+    _size: int
     _file = TextIOWrapper
 
     def __init__(
@@ -106,6 +146,7 @@ class Handler:
         direction: int = TO_TERM,
         file_name: str = "logging.log",
         max_file_size: int = 4096,
+        backup_count: int = 0,
     ):
         """
         Create a Handler that you can add to the logger later
@@ -148,17 +189,20 @@ class Handler:
         :type file_name: str
         :param max_file_size: available when you set `TO_FILE` to param `direction`. The unit is `byte`, (default for 4k)
         :type max_file_size: str
+        :param backup_count: full files kept as `file_name.1` (newest) .. `file_name.N`, 0 clears the file instead
+        :type backup_count: int
         """
-        # TODO: 文件按日期存储, 最大份数的设置.
+        # TODO: 文件按日期存储.
         self._direction = direction
         self.level = level
         self._clock = clock if clock else CustomClock()
         self._color = colorful
         self._file_name = file_name if direction == TO_FILE else ""
         self._max_size = max_file_size if direction == TO_FILE else 0
+        self._backups = backup_count
 
         if direction == TO_FILE:
-            self._file = open(file_name, "a+")
+            self._open_file("a")
 
         # 特么的re居然不能全局匹配, 烦了, 只能自己来.
         # m = re.match(r"&\((.*?)\)%", fmt)
@@ -225,7 +269,7 @@ class Handler:
             else ""
         )
 
-    def _msg(self, *args, level: int, name: str, fnname: str):
+    def _msg(self, *args, level: int, name: str, fnname: str, fmt: bool = False):
         """
         Log a msg
         """
@@ -234,12 +278,9 @@ class Handler:
             return
         # generate msg
         temp_map = []
-        text = ""
         for item in self._map:
             if item == _msg:
-                for text_ in args:  # 将元组内的文本添加到一起
-                    text = "%s %s" % (text, text_)  # 防止用户输入其他类型(int, float)
-                temp_map.append(text)
+                temp_map.append(format_msg(args, fmt))
             elif item == _level:
                 if self._direction == TO_TERM:  # only terminal can use color.
                     temp_map.append(level_name(level, self._color))
@@ -261,26 +302,147 @@ class Handler:
     def _to_term(self, map: tuple):
         print(self._template % map, end="")
 
+    def _open_file(self, mode: str):
+        self._mode = mode
+        self._reopen(mode)
+
+    def _reopen(self, mode: str):
+        self._file = open(self._file_name, mode)
+        # the size is counted from here on, no seek probing per record
+        try:
+            self._size = os.stat(self._file_name)[6]
+        except OSError:
+            self._size = 0
+
+    def _rotate(self):
+        """file_name -> file_name.1 -> .. -> file_name.N, the oldest is dropped"""
+        self._file.close()
+        name = self._file_name
+        mode = self._mode
+        rotated = False
+        try:
+            if self._backups:
+                # move the full file aside first, if that fails no backup is lost
+                os.rename(name, name + ".0")
+                try:
+                    os.remove("%s.%d" % (name, self._backups))
+                except OSError:
+                    pass
+                for i in range(self._backups - 1, -1, -1):
+                    try:
+                        os.rename("%s.%d" % (name, i), "%s.%d" % (name, i + 1))
+                    except OSError:
+                        pass  # not that many generations yet
+            else:
+                mode = mode.replace("a", "w")  # 清空文件内容
+            rotated = True
+        except OSError:
+            pass  # flash full or busy, keep appending to the current file
+        finally:
+            # a handler without an open file would fail on every record
+            self._reopen(mode)
+            if not rotated:
+                # next attempt after another max_file_size, not on every record
+                self._size = 0
+
     def _to_file(self, map: tuple):
-        fp = self._file
-        # 检查是否超出大小限制.
-        prev_idx = fp.tell()  # 保存原始指针位置
-        # 将读写指针跳到文件最大限制的地方,
-        # 如果能读出数据, 说明文件大于指定的大小
-        fp.seek(self._max_size)
-        if fp.read(1):  # 能读到数据, 说明超出大小限制了
-            fp = self._file = open(self._file_name, "w")  # 使用 w 选项清空文件内容
-        else:
-            # 没有超出限制
-            fp.seek(prev_idx)  # 指针回到原来的地方
+        text = self._template % map
+        # bytes, not characters - non-ASCII text is longer on flash
+        size = len(text.encode())
+        if self._size + size > self._max_size:
+            self._rotate()
+        self._file.write(text)
+        self._size += size
+        self._file.flush()
 
-        # 检查完毕, 开始写入数据
-        fp.write(self._template % map)
-        fp.flush()
+
+class BufferedFileHandler(Handler):
+    """
+    File handler which collects records in a fixed RAM buffer and writes
+    them to flash in batches.
+
+    The buffer is written out when it fills past `flush_threshold`, when a
+    record of `flush_level` or above arrives, and periodically by the
+    `run()` coroutine.
+    Full files are rotated to numbered generations, see `backup_count`.
+    """
+
+    def __init__(
+        self,
+        level: int = INFO,
+        fmt: str = "&(time)% - &(level)% - &(name)% - &(msg)%",
+        clock: BaseClock = None,
+        file_name: str = "logging.log",
+        max_file_size: int = 4096,
+        backup_count: int = 0,
+        buffer_size: int = 1024,
+        flush_threshold: int = 768,
+        flush_level: int = ERROR,
+    ):
+        super().__init__(
+            level=level,
+            colorful=False,
+            fmt=fmt,
+            clock=clock,
+            backup_count=backup_count,
+        )
+        self._direction = TO_FILE
+        self._file_name = file_name
+        self._max_size = max_file_size
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._used = 0
+        self._threshold = flush_threshold
+        self._flush_level = flush_level
+        self._open_file("ab")
+        self.writes = 0  # flash writes, for comparison with per record writes
+
+    def _msg(self, *args, level: int, name: str, fnname: str, fmt: bool = False):
+        super()._msg(*args, level=level, name=name, fnname=fnname, fmt=fmt)
+        if level >= self._flush_level:
+            self.flush()
+
+    def _to_file(self, map: tuple):
+        record = (self._template % map).encode()
+        size = len(record)
+        if self._used + size > len(self._buf):
+            self.flush()
+        if size > len(self._buf):
+            self._write(record)
+            return
+        self._buf[self._used : self._used + size] = record
+        self._used += size
+        if self._used >= self._threshold:
+            self.flush()
+
+    def _write(self, data):
+        if self._size + len(data) > self._max_size:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+        self.writes += 1
+
+    def flush(self):
+        if not self._used:
+            return
+        self._write(self._view[: self._used])
+        self._file.flush()
+        self._used = 0
+
+    async def run(self, interval: int = 30):
+        """flush whatever is buffered every `interval` seconds"""
+        try:
+            import uasyncio as asyncio
+        except ImportError:
+            import asyncio
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
 
 
 class Logger:
     _handlers: list
+    level: int
 
     def __init__(
         self,
@@ -294,33 +456,54 @@ class Logger:
             self._handlers = [Handler()]
         else:
             self._handlers = handlers
+        self.update_level()
 
     @property
     def handlers(self):
         return self._handlers
 
-    def _msg(self, *args, level: int, fn: str):
+    def update_level(self):
+        """
+        Cache the lowest level of the handlers, records below it return
+        right away. Call it after changing a handler level directly.
+        """
+        self.level = min([item.level for item in self._handlers])
+
+    def set_level(self, level: int):
+        for item in self._handlers:
+            item.level = level
+        self.level = level
 
+    def _msg(self, *args, level: int, fn: str, fmt: bool):
+        if level < self.level:
+            return
         for item in self._handlers:
             # try:
-            item._msg(*args, level=level, fnname=fn, name=self.name)
+            item._msg(*args, level=level, fnname=fn, name=self.name, fmt=fmt)
             # except:
             #    print("Failed while trying to record")
 
-    def debug(self, *args, fn: str = None):
-        self._msg(*args, level=DEBUG, fn=fn)
+    # the level checks are repeated here so a suppressed record does not
+    # even pay for packing the args into the _msg call
+    # fmt=True %-formats the first arg with the others, see format_msg
+    def debug(self, *args, fn: str = None, fmt: bool = False):
+        if DEBUG >= self.level:
+            self._msg(*args, level=DEBUG, fn=fn, fmt=fmt)
 
-    def info(self, *args, fn: str = None):
-        self._msg(*args, level=INFO, fn=fn)
+    def info(self, *args, fn: str = None, fmt: bool = False):
+        if INFO >= self.level:
+            self._msg(*args, level=INFO, fn=fn, fmt=fmt)
 
-    def warn(self, *args, fn: str = None):
-        self._msg(*args, level=WARN, fn=fn)
+    def warn(self, *args, fn: str = None, fmt: bool = False):
+        if WARN >= self.level:
+            self._msg(*args, level=WARN, fn=fn, fmt=fmt)
 
-    def error(self, *args, fn: str = None):
-        self._msg(*args, level=ERROR, fn=fn)
+    def error(self, *args, fn: str = None, fmt: bool = False):
+        if ERROR >= self.level:
+            self._msg(*args, level=ERROR, fn=fn, fmt=fmt)
 
-    def critical(self, *args, fn: str = None):
-        self._msg(*args, level=CRITICAL, fn=fn)
+    def critical(self, *args, fn: str = None, fmt: bool = False):
+        self._msg(*args, level=CRITICAL, fn=fn, fmt=fmt)
 
 
 _loggers = {}
@@ -357,6 +540,7 @@ def critical(msg, *args):
 __all__ = [
     Logger,
     Handler,
+    BufferedFileHandler,
     BaseClock,
     DEBUG,
     INFO,
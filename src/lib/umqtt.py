@@ -0,0 +1,222 @@
+# minimal MQTT 3.1.1 client
+# based on micropython-lib umqtt.simple (MIT License)
+# https://github.com/micropython/micropython-lib/tree/master/micropython/umqtt.simple
+
+import time
+import usocket
+import ustruct as struct
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    def __init__(
+        self,
+        client_id,
+        server,
+        port=1883,
+        user=None,
+        password=None,
+        keepalive=0,
+        timeout=None,
+    ):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.sock = None
+        self.pid = 0
+        self.cb = None
+        self.body = b""  # rest of the last non-PUBLISH packet read by wait_msg
+        # ticks of the last PINGREQ sent / PINGRESP received
+        self.last_ping = self.last_pong = time.ticks_ms()
+
+    def set_callback(self, f):
+        """f(topic, msg) called for every PUBLISH received"""
+        self.cb = f
+
+    def _write(self, buf, length=None):
+        if length is None:
+            self.sock.write(buf)
+        else:
+            self.sock.write(memoryview(buf)[:length])
+
+    def _read(self, n):
+        data = self.sock.read(n)
+        if not data:
+            raise OSError(-1)  # connection closed by broker
+        return data
+
+    def _send_str(self, s):
+        self._write(struct.pack("!H", len(s)))
+        self._write(s)
+
+    def _recv_len(self):
+        n = 0
+        sh = 0
+        while True:
+            b = self._read(1)[0]
+            n |= (b & 0x7F) << sh
+            if not b & 0x80:
+                return n
+            sh += 7
+
+    def _next_pid(self):
+        self.pid = self.pid % 0xFFFF + 1
+        return self.pid
+
+    @staticmethod
+    def _encode_len(pkt, i, sz):
+        """remaining length as varint into pkt starting at i, returns next index"""
+        while sz > 0x7F:
+            pkt[i] = (sz & 0x7F) | 0x80
+            sz >>= 7
+            i += 1
+        pkt[i] = sz
+        return i + 1
+
+    def connect(self, clean_session=True):
+        self.sock = usocket.socket()
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        addr = usocket.getaddrinfo(self.server, self.port)[0][-1]
+        self.sock.connect(addr)
+
+        msg = bytearray(b"\x00\x04MQTT\x04\x00\x00\x00")
+        sz = 10 + 2 + len(self.client_id)
+        msg[7] = clean_session << 1
+        if self.user is not None:
+            sz += 2 + len(self.user) + 2 + len(self.pswd)
+            msg[7] |= 0xC0
+        if self.keepalive:
+            msg[8] = self.keepalive >> 8
+            msg[9] = self.keepalive & 0xFF
+
+        premsg = bytearray(b"\x10\0\0\0\0")
+        self._write(premsg, self._encode_len(premsg, 1, sz))
+        self._write(msg)
+        self._send_str(self.client_id)
+        if self.user is not None:
+            self._send_str(self.user)
+            self._send_str(self.pswd)
+
+        resp = self._read(4)
+        if resp[0] != 0x20 or resp[1] != 0x02:
+            raise MQTTException("unexpected CONNACK")
+        if resp[3] != 0:
+            raise MQTTException(resp[3])
+        self.last_ping = self.last_pong = time.ticks_ms()
+        return resp[2] & 1  # session present
+
+    def disconnect(self):
+        try:
+            self._write(b"\xe0\0")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def ping(self):
+        self._write(b"\xc0\0")
+        self.last_ping = time.ticks_ms()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        pkt = bytearray(b"\x30\0\0\0\0")
+        pkt[0] |= qos << 1 | retain
+        sz = 2 + len(topic) + len(msg)
+        if qos > 0:
+            sz += 2
+        self._write(pkt, self._encode_len(pkt, 1, sz))
+        self._send_str(topic)
+        if qos > 0:
+            pid = self._next_pid()
+            struct.pack_into("!H", pkt, 0, pid)
+            self._write(pkt, 2)
+        self._write(msg)
+        if qos == 1:
+            # wait for PUBACK, dispatching anything the broker sends meanwhile
+            while True:
+                op = self.wait_msg()
+                if op == 0x40:
+                    rcv_pid = self.body
+                    if len(rcv_pid) != 2:
+                        raise MQTTException("malformed PUBACK")
+                    if pid == rcv_pid[0] << 8 | rcv_pid[1]:
+                        return
+        elif qos == 2:
+            raise MQTTException("QoS 2 not supported")
+
+    def subscribe(self, topic, qos=0):
+        pkt = bytearray(b"\x82\0\0\0")
+        pid = self._next_pid()
+        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, pid)
+        self._write(pkt)
+        self._send_str(topic)
+        self._write(bytes((qos,)))
+        while True:
+            op = self.wait_msg()
+            if op == 0x90:
+                resp = self.body
+                if len(resp) != 3:
+                    raise MQTTException("malformed SUBACK")
+                if resp[0] != pid >> 8 or resp[1] != pid & 0xFF:
+                    continue
+                if resp[2] == 0x80:
+                    raise MQTTException(resp[2])
+                return
+
+    def wait_msg(self, op=None):
+        """read a single packet; PUBLISH is dispatched to the callback
+
+        returns the packet type byte,
+        the rest of any packet but PUBLISH is consumed and left in self.body"""
+        if op is None:
+            op = self._read(1)[0]
+        sz = self._recv_len()
+        if op & 0xF0 != 0x30:
+            # never leave unread bytes behind, they would be parsed as a header
+            self.body = self._read(sz) if sz else b""
+            if op == 0xD0:  # PINGRESP
+                self.last_pong = time.ticks_ms()
+            return op
+
+        topic_len = self._read(2)
+        topic_len = topic_len[0] << 8 | topic_len[1]
+        topic = self._read(topic_len)
+        sz -= topic_len + 2
+        if op & 6:
+            pid = self._read(2)
+            pid = pid[0] << 8 | pid[1]
+            sz -= 2
+        msg = self._read(sz) if sz else b""
+        if self.cb:
+            self.cb(topic, msg)
+        if op & 6 == 2:
+            pkt = bytearray(b"\x40\x02\0\0")
+            struct.pack_into("!H", pkt, 2, pid)
+            self._write(pkt)
+        elif op & 6 == 4:
+            raise MQTTException("QoS 2 not supported")
+        return op
+
+    def check_msg(self):
+        """non-blocking wait_msg - returns None right away if nothing is pending"""
+        self.sock.setblocking(False)
+        try:
+            first = self.sock.read(1)
+        finally:
+            # rest of the packet is read with the regular timeout
+            self.sock.settimeout(self.timeout)
+        if first is None:
+            return None
+        if first == b"":
+            raise OSError(-1)
+        return self.wait_msg(first[0])
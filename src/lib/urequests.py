@@ -1,5 +1,113 @@
+import time
 import usocket
 
+_ssl_ctx = None
+_ssl_sessions = {}  # host -> TLS session of the last connection
+
+
+def ssl_context():
+    """SSL context shared by all requests, so it is set up only once"""
+    global _ssl_ctx
+    if _ssl_ctx is None:
+        try:
+            import ssl
+        except ImportError:
+            import ussl as ssl
+        if hasattr(ssl, "SSLContext"):
+            _ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            if hasattr(_ssl_ctx, "check_hostname"):
+                _ssl_ctx.check_hostname = False
+            # no certificate validation, as with the former ussl.wrap_socket
+            _ssl_ctx.verify_mode = ssl.CERT_NONE
+        else:
+            # older ports only offer the module level wrap_socket
+            _ssl_ctx = ssl
+    return _ssl_ctx
+
+
+def wrap_tls(sock, host):
+    """handshake on a connected socket, resuming the host's last session
+    where the port supports it. Returns the wrapped socket and handshake ms"""
+    start = time.ticks_ms()
+    ctx = ssl_context()
+    session = _ssl_sessions.get(host)
+    if session is not None:
+        try:
+            sock = ctx.wrap_socket(sock, server_hostname=host, session=session)
+        except TypeError:
+            # `session` kwarg not supported
+            _ssl_sessions.clear()
+            session = None
+    if session is None:
+        sock = ctx.wrap_socket(sock, server_hostname=host)
+    if getattr(sock, "session", None) is not None:
+        _ssl_sessions[host] = sock.session
+    return sock, time.ticks_diff(time.ticks_ms(), start)
+
+
+class ChunkedReader:
+    """incremental decoder of a Transfer-Encoding: chunked body
+
+    behaves like the socket it wraps (read/readinto/close) and returns
+    the payload only, the chunk framing is consumed on the way
+    broken framing raises OSError, same as a dropped connection would"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.left = 0  # bytes remaining in the current chunk
+        self.done = False
+
+    def _next_chunk(self):
+        line = self.sock.readline()
+        if not line:
+            raise OSError("HTTP error: truncated chunked body")
+        # chunk extensions after ';' are ignored
+        try:
+            self.left = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise OSError("HTTP error: bad chunk size %r" % line)
+        if self.left == 0:
+            # skip optional trailers up to the terminating empty line
+            while True:
+                line = self.sock.readline()
+                if not line or line == b"\r\n":
+                    break
+            self.done = True
+
+    def readinto(self, buf, nbytes=None):
+        n = len(buf) if nbytes is None else nbytes
+        mv = memoryview(buf)
+        got = 0
+        while got < n and not self.done:
+            if not self.left:
+                self._next_chunk()
+                continue
+            r = self.sock.readinto(mv[got : got + min(n - got, self.left)])
+            if not r:
+                raise OSError("HTTP error: truncated chunked body")
+            got += r
+            self.left -= r
+            if not self.left:
+                if self.sock.read(2) != b"\r\n":  # CRLF closing the chunk data
+                    raise OSError("HTTP error: bad chunk delimiter")
+        return got
+
+    def read(self, n=-1):
+        if n >= 0:
+            buf = bytearray(n)
+            return bytes(memoryview(buf)[: self.readinto(buf)])
+        out = bytearray()
+        buf = bytearray(256)
+        while True:
+            r = self.readinto(buf)
+            if not r:
+                break
+            out.extend(memoryview(buf)[:r])
+        return bytes(out)
+
+    def close(self):
+        self.sock.close()
+
 
 class Response:
     def __init__(self, f):
@@ -27,6 +135,28 @@ class Response:
     def text(self):
         return str(self.content, self.encoding)
 
+    def iter_content(self, chunk_size=256):
+        """yield the body in pieces of at most chunk_size bytes
+
+        the pieces are views into one reused buffer - copy them if they
+        have to outlive the next iteration. Closes the response when done"""
+        if self._cached is not None:
+            yield self._cached
+            return
+        buf = bytearray(chunk_size)
+        mv = memoryview(buf)
+        try:
+            while True:
+                n = self.raw.readinto(buf)
+                if not n:
+                    break
+                yield mv[:n]
+        finally:
+            self.close()
+
+    def __iter__(self):
+        return self.iter_content()
+
     def json(self):
         import ujson
 
@@ -45,6 +175,7 @@ def request(
     parse_headers=True,
 ):
     redirect = None  # redirection url, None means no redirection
+    chunked_resp = False
     chunked_data = (
         data and getattr(data, "__iter__", None) and not getattr(data, "__len__", None)
     )
@@ -65,8 +196,6 @@ def request(
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import ussl
-
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -78,6 +207,7 @@ def request(
     ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
     ai = ai[0]
 
+    handshake_ms = None
     resp_d = None
     if parse_headers is not False:
         resp_d = {}
@@ -92,7 +222,7 @@ def request(
     try:
         s.connect(ai[-1])
         if proto == "https:":
-            s = ussl.wrap_socket(s, server_hostname=host)
+            s, handshake_ms = wrap_tls(s, host)
         s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
         if not "Host" in headers:
             s.write(b"Host: %s\r\n" % host)
@@ -141,7 +271,7 @@ def request(
             # print(l)
             if l.startswith(b"Transfer-Encoding:"):
                 if b"chunked" in l:
-                    raise ValueError("Unsupported " + str(l, "utf-8"))
+                    chunked_resp = True
             elif l.startswith(b"Location:") and not 200 <= status <= 299:
                 if status in [301, 302, 303, 307, 308]:
                     redirect = str(l[10:-2], "utf-8")
@@ -166,9 +296,10 @@ def request(
         else:
             return request(method, redirect, data, json, headers, stream)
     else:
-        resp = Response(s)
+        resp = Response(ChunkedReader(s) if chunked_resp else s)
         resp.status_code = status
         resp.reason = reason
+        resp.handshake_ms = handshake_ms
         if resp_d is not None:
             resp.headers = resp_d
         return resp
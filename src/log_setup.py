@@ -6,7 +6,7 @@ import config as CNFG
 def term_handler(level=CNFG.LOG_LEVEL):
     """logging message parameters"""
     hdl_terminal = ulogger.Handler(
-        level=CNFG.LOG_LEVEL,
+        level=level,
         colorful=True,
         fmt="&(time)% - &(level)% - &(name)% - &(fnname)% - &(msg)%",
         clock=None,
@@ -15,11 +15,52 @@ def term_handler(level=CNFG.LOG_LEVEL):
     return hdl_terminal
 
 
+_file_handler = None
+
+
+def file_handler():
+    """the log file handler shared by all loggers, None when LOG_FILE is not set"""
+    global _file_handler
+    if _file_handler is None and CNFG.LOG_FILE:
+        _file_handler = ulogger.BufferedFileHandler(
+            level=CNFG.LOG_FILE_LEVEL,
+            fmt="&(time)% - &(level)% - &(name)% - &(msg)%",
+            file_name=CNFG.LOG_FILE,
+            max_file_size=CNFG.LOG_BUDGET // CNFG.LOG_FILES,
+            backup_count=CNFG.LOG_FILES - 1,
+            buffer_size=CNFG.LOG_BUFFER,
+            flush_threshold=CNFG.LOG_BUFFER * 3 // 4,
+        )
+    return _file_handler
+
+
 def getLogger(name=None, level=None):
-    logger = ulogger.Logger(name=name, handlers=(term_handler(level),))
+    if level is None:
+        level = CNFG.LOG_LEVEL
+    handlers = [term_handler(level)]
+    if file_handler():
+        handlers.append(file_handler())
+    logger = ulogger.Logger(name=name, handlers=handlers)
     return logger
 
 
+def benchmark(runs=1000) -> dict:
+    """us per suppressed debug record, as in the cr_measure hot path, run from REPL:
+    log_setup.benchmark()"""
+    logger = getLogger("benchmark", ulogger.INFO)
+    sample = {"cels": 21.5, "hum": 40.25}
+    result = {}
+    for name, record in (
+        ("eager", lambda: logger.debug(f"SHT3X {sample}")),
+        ("deferred", lambda: logger.debug("SHT3X %s", sample, fmt=True)),
+    ):
+        start = time.ticks_us()
+        for _ in range(runs):
+            record()
+        result[name] = time.ticks_diff(time.ticks_us(), start) / runs
+    return result
+
+
 # def test():
 #     log = getLogger()
 #     log.debug("DEBUG")
@@ -5,13 +5,17 @@ from machine import Pin, I2C, ADC, SPI
 import uasyncio
 
 import log_setup
+from ulogger import Lazy
 
 import config as CNFG
 from hardware_init import Initializer
 from datastore import Data as DS
 import lcd
 
-from blynk import BlApi
+import backend
+import metrics
+from cadence import UploadCadence
+from httpd import HttpApi
 
 logger = log_setup.getLogger("main")
 
@@ -23,7 +27,7 @@ def mem_cleanup():
     start = gc.mem_free()
     gc.collect()
     free = gc.mem_free()
-    logger.debug(f"Freed {free - start} bytes of RAM. Current: {free}")
+    logger.debug("Freed %d bytes of RAM. Current: %d", free - start, free, fmt=True)
     del start, free
 
 
@@ -34,18 +38,38 @@ class Orchestrator:
         init = Initializer()
         self.hw = init.devices
         self.data = DS()
+        self.slides = lcd.SlideScheduler(self.hw, self.data)
+        # alerts reach the display right away, not at the next slide change
+        self.hw["wifi"].on_change(self.slides.notify)
+        if self.hw[CNFG.R_ID_PUMP]:
+            self.hw[CNFG.R_ID_PUMP].level_sensor.irq(
+                handler=self.slides.notify, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING
+            )
+        if CNFG.LCD_BUTTON is not None:
+            self.button = Pin(CNFG.LCD_BUTTON, Pin.IN, Pin.PULL_UP)
+            self.button.irq(handler=self.slides.button, trigger=Pin.IRQ_FALLING)
         logger.info("Initing cloud comm")
-        self.cloud = BlApi()
+        self.cloud = backend.get_backend()
+        self.cloud.on_change("EN_PUMP", self.on_cloud_pump_switch)
+        self.cadence = UploadCadence()
+
+    def on_cloud_pump_switch(self, old, new):
+        """don't wait for the relay loop if the cloud disabled a running pump"""
+        if not new and self.hw[CNFG.R_ID_PUMP].enabled:
+            logger.info("Cloud turned the pump off")
+            self.hw[CNFG.R_ID_PUMP].off()
 
     async def cr_measure(self):
         """measure oneshot sensors in periodic intervals"""
         while True:
+            start = time.ticks_ms()
             # DS18
             if self.hw["ds18"]:
                 if len(self.hw["ds18"].scan()) > 0:
                     self.data.update_ds18(self.hw["ds18"])
                 else:
                     logger.warn("No DS18 devices found. Skipping...")
+                    self.data.clear_ds18()
             # BH1750
             time.sleep(CNFG.T_BUS_DELAY)
             if self.hw["bh1750"]:
@@ -59,41 +83,15 @@ class Orchestrator:
             if self.hw["ads"]:
                 self.data.update_ads(self.hw["ads"])
             logger.info("Collection cycle - OK")
+            metrics.set_gauge(
+                "measure_cycle_seconds", time.ticks_diff(time.ticks_ms(), start) / 1000
+            )
             await uasyncio.sleep(CNFG.T_MEAS)
 
     async def cr_lcd(self):
         """coroutine updating content on the LCD
-        it generates LCD "slides" based on current data and then
-        displays them one by one"""
-        while True:
-            # prepare LCD frames into buffer; only if data are present
-            self.data.lcd_messages.append(lcd.network_status(self.hw["wifi"].sta_if))
-            if self.data.ds18 and self.data.bh1750:
-                self.data.lcd_messages.append(
-                    lcd.ds18_and_light(self.data.ds18, self.data.bh1750)
-                )
-            if self.data.sht:
-                self.data.lcd_messages.append(lcd.sht(self.data.sht))
-            if self.data.ads:
-                self.data.lcd_messages.append(lcd.soil_humidity(self.data))
-            if self.hw["relay"]:
-                self.data.lcd_messages.append(lcd.relay_states(self.hw["relay"]))
-
-            # show them one by one while emptying the buffer
-            while self.data.lcd_messages:
-                msg = self.data.lcd_messages.pop()
-                logger.debug(f"LCD msg: {msg}")
-                try:
-                    self.hw["lcd"].longtext(msg, CNFG.LCD_MAX_CHAR)
-                    await uasyncio.sleep(CNFG.T_LCD_FRAME - 1)
-                    # show "offline" msg for 1 sec if not connected
-                    if not self.hw["wifi"].sta_if.isconnected():
-                        lcd.network_error(self.hw["lcd"], self.hw["gfx"])
-                    await uasyncio.sleep(1)
-
-                except (OSError, AttributeError):
-                    logger.error("Failed to display LCD text")
-                    await uasyncio.sleep(CNFG.T_LCD_FRAME)
+        slides rotate by priority, alerts preempt them, see lcd.SlideScheduler"""
+        await self.slides.run(self.hw["lcd"])
 
     def handle_relay_pump(self):
         """handles relay for the pump based on the soil humidity sensor,
@@ -213,20 +211,34 @@ class Orchestrator:
 
     async def cr_cloud(self):
         """coroutine responsible for cloud communication
-        also, if network is connected, sync NTP if it failed before"""
+        readings are pushed at an adaptive rate, settings fetched every T_NETWORK_UPDATE
+        """
+        last_fetch = None
         while True:
-            mem_cleanup()
-            self.cloud.update_streams(self.hw, self.data)
-
-            if self.hw["wifi"].sta_if.isconnected():
-                # resync time if network works and it did not work before
-                if not self.hw["ntp"].synced:
-                    self.hw["ntp"].sync_ntp_time(self.hw["wifi"])
-                self.cloud.fetch_pump_setting(self.hw)
-            else:
-                logger.warn("Pump setting fetch not attempted.")
-            mem_cleanup()
-            await uasyncio.sleep(CNFG.T_NETWORK_UPDATE)
+            payload = self.cloud.create_payload(self.hw, self.data)
+            if self.cadence.due(payload):
+                mem_cleanup()
+                if self.cloud.update_streams(self.hw, self.data, payload):
+                    self.cadence.uploaded(payload)
+                logger.debug("Upload rate: %.1f / h", Lazy(self.cadence.rate), fmt=True)
+            del payload
+            metrics.set_gauge("upload_rate_per_hour", self.cadence.rate())
+
+            if (
+                last_fetch is None
+                or time.ticks_diff(time.ticks_ms(), last_fetch)
+                >= CNFG.T_NETWORK_UPDATE * 1000
+            ):
+                last_fetch = time.ticks_ms()
+                if self.hw["wifi"].is_up():
+                    self.cloud.fetch_settings(self.hw)
+                else:
+                    logger.warn("Cloud settings fetch not attempted.")
+                logger.debug(
+                    "Cloud comm stats: %s", Lazy(self.cloud.breaker.stats), fmt=True
+                )
+                mem_cleanup()
+            await self.cloud.wait(self.hw, CNFG.T_NETWORK_MIN)
 
     def start(self):
         """asyncio handler - adds tasks into the event loop and runs it forever"""
@@ -235,10 +247,18 @@ class Orchestrator:
         loop.create_task(self.cr_measure())
         loop.create_task(self.cr_lcd())
         loop.create_task(self.cr_relays())
+        loop.create_task(self.hw["wifi"].run())
+        loop.create_task(self.hw["ntp"].run(self.hw["wifi"]))
 
         if self.cloud:
             loop.create_task(self.cr_cloud())
 
+        if CNFG.HTTP_API_PORT:
+            loop.create_task(HttpApi(self.hw, self.data).serve())
+
+        if log_setup.file_handler():
+            loop.create_task(log_setup.file_handler().run(CNFG.T_LOG_FLUSH))
+
         loop.run_forever()
 
 
@@ -260,3 +280,12 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         logger.info("stopped by user")
+
+    except Exception as exc:
+        # CRITICAL flushes the log buffer, the reason of the crash reaches flash
+        logger.critical(exc)
+        raise
+
+    finally:
+        if log_setup.file_handler():
+            log_setup.file_handler().flush()
@@ -0,0 +1,134 @@
+# internal performance counters and Prometheus text-format exporter
+import gc
+from ubinascii import hexlify
+
+import config as CNFG
+
+PREFIX = "boxmon_"
+
+# (name, label value) -> count
+counters = {}
+# name -> last value
+gauges = {}
+
+
+def inc(name, label=None, n=1):
+    key = (name, label)
+    counters[key] = counters.get(key, 0) + n
+
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+
+class Histogram:
+    """cumulative-bucket histogram as Prometheus expects it"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+histograms = {
+    "cloud_request_seconds": Histogram((0.25, 0.5, 1, 2, 5, 10)),
+}
+
+# name -> (type, help, label name)
+META = {
+    "ds18_celsius": ("gauge", "Soil temperature", "sensor"),
+    "sht_celsius": ("gauge", "Atmospheric temperature", None),
+    "sht_humidity_percent": ("gauge", "Atmospheric relative humidity", None),
+    "bh1750_lux": ("gauge", "Light intensity", None),
+    "soil_humidity_percent": ("gauge", "Soil humidity per channel", "channel"),
+    "soil_humidity_avg_percent": ("gauge", "Soil humidity average", None),
+    "relay_on_seconds_total": ("counter", "Time the relay spent on", "relay"),
+    "mem_free_bytes": ("gauge", "gc.mem_free()", None),
+    "measure_cycle_seconds": ("gauge", "Duration of the last measurement cycle", None),
+    "i2c_errors_total": ("counter", "Failed I2C sensor reads", "device"),
+    "wifi_reconnects_total": ("counter", "Wi-Fi reconnection attempts", None),
+    "wifi_connect_seconds": ("gauge", "Duration of the last Wi-Fi connect", None),
+    "ntp_latency_seconds": ("gauge", "Round trip of the last NTP query", None),
+    "ntp_offset_seconds": ("gauge", "RTC error corrected by the last NTP sync", None),
+    "ntp_drift_ppm": ("gauge", "RTC drift measured between NTP syncs", None),
+    "lcd_bytes_sent_total": ("counter", "Framebuffer bytes sent to the display", None),
+    "lcd_bytes_saved_total": ("counter", "Bytes skipped by partial flushes", None),
+    "lcd_bytes_per_hour": ("gauge", "Display bytes sent in the last full hour", None),
+    "lcd_chart_render_seconds": ("gauge", "Draw time of the last chart slide", None),
+    "cloud_request_seconds": ("histogram", "Cloud request latency", None),
+    "upload_rate_per_hour": ("gauge", "Average cloud uploads per hour", None),
+}
+
+
+def _header(name):
+    typ, hlp, _ = META[name]
+    yield f"# HELP {PREFIX}{name} {hlp}\n"
+    yield f"# TYPE {PREFIX}{name} {typ}\n"
+
+
+def _sample(name, value, label=None):
+    if label is None:
+        return f"{PREFIX}{name} {value}\n"
+    return f'{PREFIX}{name}{{{META[name][2]}="{label}"}} {value}\n'
+
+
+def render(hw, data):
+    """yield the exposition text line by line, nothing is built as a whole"""
+    # sensors
+    if data.ds18:
+        yield from _header("ds18_celsius")
+        for addr, value in data.ds18.items():
+            yield _sample("ds18_celsius", value, hexlify(addr).decode())
+    if data.sht:
+        yield from _header("sht_celsius")
+        yield _sample("sht_celsius", data.sht["cels"])
+        yield from _header("sht_humidity_percent")
+        yield _sample("sht_humidity_percent", data.sht["hum"])
+    yield from _header("bh1750_lux")
+    yield _sample("bh1750_lux", data.bh1750)
+    if data.ads:
+        yield from _header("soil_humidity_percent")
+        for channel, value in enumerate(data.ads):
+            yield _sample("soil_humidity_percent", value, channel)
+        yield from _header("soil_humidity_avg_percent")
+        yield _sample("soil_humidity_avg_percent", data.ads_avg)
+
+    yield from _header("relay_on_seconds_total")
+    for name in CNFG.RELAY:
+        if hw.get(name):
+            yield _sample("relay_on_seconds_total", hw[name].on_time_ms() / 1000, name)
+
+    # internals
+    if hw.get("lcd"):
+        yield from _header("lcd_bytes_sent_total")
+        yield _sample("lcd_bytes_sent_total", hw["lcd"].total_sent)
+        yield from _header("lcd_bytes_saved_total")
+        yield _sample("lcd_bytes_saved_total", hw["lcd"].total_saved)
+    yield from _header("mem_free_bytes")
+    yield _sample("mem_free_bytes", gc.mem_free())
+    for name, value in gauges.items():
+        yield from _header(name)
+        yield _sample(name, value)
+
+    last = None
+    for (name, label), value in sorted(counters.items(), key=lambda kv: kv[0][0]):
+        if name != last:
+            yield from _header(name)
+            last = name
+        yield _sample(name, value, label)
+
+    for name, hist in histograms.items():
+        yield from _header(name)
+        for bound, count in zip(hist.buckets, hist.counts):
+            yield f'{PREFIX}{name}_bucket{{le="{bound}"}} {count}\n'
+        yield f'{PREFIX}{name}_bucket{{le="+Inf"}} {hist.count}\n'
+        yield f"{PREFIX}{name}_sum {hist.sum}\n"
+        yield f"{PREFIX}{name}_count {hist.count}\n"
@@ -0,0 +1,172 @@
+import time
+
+import uasyncio
+
+from lib.umqtt import MQTTClient, MQTTException
+import config as CNFG
+import log_setup
+from backend import Backend
+
+logger = log_setup.getLogger("mqtt")
+
+
+class MqttApi(Backend):
+    """MQTT backend - one long-lived connection, settings pushed by the broker"""
+
+    def __init__(self):
+        super().__init__()
+        self.client = MQTTClient(
+            CNFG.DHCP_HOSTNAME,
+            CNFG.MQTT_HOST,
+            port=CNFG.MQTT_PORT,
+            user=CNFG.MQTT_USER,
+            password=CNFG.MQTT_PASSWORD,
+            keepalive=CNFG.MQTT_KEEPALIVE,
+            timeout=CNFG.HTTP_TIMEOUT,
+        )
+        self.client.set_callback(self.on_message)
+        self.connected = False
+        self.hw = None  # for the message callback
+        self.topics = {}
+        for setting in self.settings:
+            topic = f"{CNFG.MQTT_TOPIC}/set/{setting.name}"
+            self.topics[topic.encode()] = setting
+
+    def connect(self, hw) -> bool:
+        """(re)establish the session, guarded by the circuit breaker"""
+        self.hw = hw
+        if self.connected:
+            return True
+        if not self.breaker.allow():
+            logger.debug("MQTT connect skipped - backing off")
+            return False
+        if not hw["wifi"].is_up():
+            self.comm_failed(hw)
+            return False
+        try:
+            self.client.connect()
+            # retained setting values are delivered right after subscribing
+            for topic in self.topics:
+                self.client.subscribe(topic, qos=1)
+        except (OSError, MQTTException) as exc:
+            logger.error(f"MQTT connect failed. {exc}")
+            self.client.close()
+            self.comm_failed(hw)
+            return False
+        self.breaker.success()
+        self.connected = True
+        logger.info(f"MQTT connected to {CNFG.MQTT_HOST}")
+        return True
+
+    def connection_lost(self, hw, exc):
+        logger.error(f"MQTT connection lost. {exc}")
+        self.connected = False
+        self.client.close()
+        self.comm_failed(hw)
+
+    def on_message(self, topic, msg):
+        setting = self.topics.get(topic)
+        if setting:
+            self.apply_setting(self.hw, setting, str(msg, "utf-8"))
+        else:
+            logger.debug(f"MQTT message on unexpected topic {topic}")
+
+    def update_streams(self, hw, data, payload=None):
+        if not self.connect(hw):
+            return False
+        if payload is None:
+            payload = self.create_payload(hw, data)
+        logger.debug(payload)
+        try:
+            for pin, value in payload:
+                topic = f"{CNFG.MQTT_TOPIC}/V{pin}"
+                self.client.publish(
+                    topic.encode(), str(value).encode(), qos=CNFG.MQTT_QOS
+                )
+            logger.info("Readings published")
+            return True
+        except (OSError, MQTTException) as exc:
+            self.connection_lost(hw, exc)
+            return False
+        finally:
+            del payload
+
+    def poll(self, hw):
+        """process pushed messages without blocking, keep the session alive
+
+        a lost session is re-established here too (breaker-gated), pushed
+        settings must not wait for the next upload which may be T_NETWORK_MAX away"""
+        if not self.connected and not self.connect(hw):
+            return
+        try:
+            # drain everything pending, PINGRESP included
+            while self.client.check_msg() is not None:
+                pass
+            if not CNFG.MQTT_KEEPALIVE:
+                return
+            now = time.ticks_ms()
+            silent = time.ticks_diff(now, self.client.last_pong)
+            if silent > CNFG.MQTT_KEEPALIVE * 1500:
+                # half-open TCP - the broker stopped answering, writes still succeed
+                raise MQTTException("no PINGRESP")
+            if (
+                silent > CNFG.MQTT_KEEPALIVE * 500
+                and time.ticks_diff(now, self.client.last_ping)
+                > CNFG.MQTT_KEEPALIVE * 500
+            ):
+                self.client.ping()
+        except (OSError, MQTTException) as exc:
+            self.connection_lost(hw, exc)
+
+    def fetch_settings(self, hw):
+        # nothing to request, settings arrive by subscription
+        self.poll(hw)
+
+    async def wait(self, hw, seconds):
+        deadline = time.ticks_add(time.ticks_ms(), seconds * 1000)
+        while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            self.poll(hw)
+            await uasyncio.sleep_ms(CNFG.MQTT_POLL_INTERVAL)
+
+
+def self_test(host=CNFG.MQTT_HOST, port=CNFG.MQTT_PORT, timeout=5) -> bool:
+    """exercise connect, subscribe, publish (QoS 1 loopback) and ping
+    against a real broker, run from REPL or the unix port:
+    mqtt.self_test()  /  mqtt.self_test("127.0.0.1")"""
+    topic = f"{CNFG.MQTT_TOPIC}/self_test".encode()
+    got = []
+    client = MQTTClient(
+        CNFG.DHCP_HOSTNAME + "-test",
+        host,
+        port=port,
+        user=CNFG.MQTT_USER,
+        password=CNFG.MQTT_PASSWORD,
+        keepalive=CNFG.MQTT_KEEPALIVE,
+        timeout=timeout,
+    )
+    client.set_callback(lambda t, m: got.append((t, m)))
+    steps = ("connect", "subscribe", "publish", "echo", "ping")
+    step = steps[0]
+    try:
+        client.connect()
+        step = steps[1]
+        client.subscribe(topic, qos=1)
+        step = steps[2]
+        client.publish(topic, b"ping", qos=1)
+        step = steps[3]
+        # the broker routes our own message back to us
+        while not got:
+            client.wait_msg()
+        if got[0] != (topic, b"ping"):
+            raise MQTTException(f"unexpected message {got[0]}")
+        step = steps[4]
+        client.ping()
+        while client.wait_msg() != 0xD0:  # PINGRESP
+            pass
+        client.disconnect()
+    except (OSError, MQTTException) as exc:
+        logger.error(f"MQTT self test failed at {step}. {exc}")
+        client.close()
+        return False
+    logger.info("MQTT self test passed")
+    return True
@@ -2,22 +2,55 @@
 from lib import daylightsaving
 import time
 import network
-import ntptime
 import machine
-import sys
 import gc
+import os
+import errno
+import usocket
+import ustruct as struct
+import ujson
+from ubinascii import hexlify, unhexlify
+
+import uasyncio
 
 import config as CNFG
+import metrics
 
 import log_setup
 
 logger = log_setup.getLogger("wifintp")
-ntptime.timeout = CNFG.HTTP_TIMEOUT
+
+# seconds between the NTP era start (1900) and the port's epoch
+NTP_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800
+
+# link statuses after which waiting for the connection is pointless
+FAILED_STATUS = tuple(
+    getattr(network, name)
+    for name in ("STAT_WRONG_PASSWORD", "STAT_NO_AP_FOUND", "STAT_CONNECT_FAIL")
+    if hasattr(network, name)
+)
+
+
+def rtc_ms() -> int:
+    """current RTC time in ms since epoch"""
+    if hasattr(time, "time_ns"):
+        return time.time_ns() // 1000000
+    return time.time() * 1000
 
 
 class WifiScifi:
     def __init__(self):
         self.conn_attempts = 1
+        self.up = False
+        self.reconnect = False
+        self.callbacks = []
+        # last good SSID, BSSID, channel and IP config for a targeted reconnect
+        self.cache = self.load_cache()
+        self.connect_ms = None  # duration of the last successful connect
+        # configured networks seen by the last scan, best first
+        self.scan_results = None
+        self.scan_time = 0
+        self.scan_stale = False  # results led nowhere, rescan after WIFI_RESCAN_MIN
 
         self.deactivate_ap()
         self.sta_if = None
@@ -34,11 +67,136 @@ class WifiScifi:
             self.ap_if.active(False)
         del self.ap_if
 
-    def connect(self, ssid, pwd):
+    def load_cache(self):
+        try:
+            with open(CNFG.WIFI_CACHE_FILE) as f:
+                return ujson.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_cache(self, ssid, bssid, channel):
+        """remember where we got connected; flash is written only on change"""
+        cache = {
+            "ssid": ssid,
+            "bssid": bssid,
+            "channel": channel,
+            "ifconfig": list(self.sta_if.ifconfig()),
+        }
+        if cache == self.cache:
+            return
+        self.cache = cache
+        try:
+            with open(CNFG.WIFI_CACHE_FILE, "w") as f:
+                ujson.dump(cache, f)
+        except OSError as exc:
+            logger.error(f"Failed to store Wi-Fi cache. {exc}")
+
+    def drop_cache(self):
+        """the cached AP stopped answering, don't target it again after a reboot"""
+        self.cache = None
+        try:
+            os.remove(CNFG.WIFI_CACHE_FILE)
+        except OSError:
+            pass
+
+    def use_dhcp(self):
+        """drop a static config possibly left behind by a fast reconnect"""
+        try:
+            self.sta_if.ifconfig("dhcp")
+        except (OSError, TypeError, ValueError):
+            try:
+                self.sta_if.config(dhcp=True)
+            except (OSError, TypeError, ValueError):
+                pass  # neither is understood by older ports, DHCP is their default
+
+    def apply_ip_config(self):
+        """static IP from config or the cached lease if allowed, DHCP otherwise
+
+        only valid for the cached SSID, other networks have other subnets"""
+        ip = CNFG.WIFI_STATIC_IP
+        if not ip and CNFG.WIFI_REUSE_LEASE:
+            ip = tuple(self.cache["ifconfig"])
+        if not ip:
+            self.use_dhcp()
+            return
+        try:
+            self.sta_if.ifconfig(ip)
+        except (OSError, TypeError, ValueError) as exc:
+            logger.warn(f"Static IP config refused, using DHCP. {exc}")
+            self.use_dhcp()
+
+    def link_info(self, ssid, bssid, channel):
+        """(ssid, bssid hex, channel) read back from the live connection
+
+        the requested values are kept where the port can't report them"""
+        try:
+            ssid = self.sta_if.config("ssid")
+        except (OSError, ValueError):
+            pass
+        try:
+            bssid = hexlify(self.sta_if.config("bssid")).decode()
+        except (OSError, ValueError):
+            pass
+        try:
+            channel = self.sta_if.config("channel")
+        except (OSError, ValueError):
+            pass
+        return ssid, bssid, channel
+
+    def is_up(self) -> bool:
+        """link state as last seen by the manager, never blocks"""
+        return self.up
+
+    def on_change(self, callback):
+        """register callback(up) fired when the link goes up or down"""
+        self.callbacks.append(callback)
+
+    def set_state(self, up):
+        if up == self.up:
+            return
+        self.up = up
+        logger.info(f"Wi-Fi link {'up' if up else 'down'}")
+        for callback in self.callbacks:
+            callback(up)
+
+    def request_reconnect(self):
+        """ask the manager to re-establish the link, returns immediately"""
+        self.reconnect = True
+
+    async def scan(self, ntw_list) -> list:
+        """single scan ranked by RSSI: [(ssid, bssid hex, channel, rssi)]
+
+        only configured SSIDs are kept, each with its strongest AP.
+        Results are reused for WIFI_SCAN_CACHE sec., stale ones for WIFI_RESCAN_MIN"""
+        age = time.ticks_diff(time.ticks_ms(), self.scan_time)
+        keep = CNFG.WIFI_RESCAN_MIN if self.scan_stale else CNFG.WIFI_SCAN_CACHE
+        if self.scan_results is not None and age < keep * 1000:
+            return self.scan_results
+        if not self.sta_if.active():
+            self.sta_if.active(True)
+        best = {}
+        try:
+            # the scan blocks the loop for seconds, let pending tasks run around it
+            await uasyncio.sleep_ms(0)
+            nets = self.sta_if.scan()
+            await uasyncio.sleep_ms(0)
+            for net in nets:
+                ssid = net[0].decode()
+                if ssid in ntw_list and (ssid not in best or net[3] > best[ssid][3]):
+                    best[ssid] = (ssid, hexlify(net[1]).decode(), net[2], net[3])
+        except OSError as exc:
+            logger.error(f"Wi-Fi scan failed. {exc}")
+        self.scan_results = sorted(best.values(), key=lambda net: net[3], reverse=True)
+        self.scan_time = time.ticks_ms()
+        self.scan_stale = False
+        logger.debug(f"Visible configured networks: {self.scan_results}")
+        return self.scan_results
+
+    async def connect(self, ssid, pwd, bssid=None):
         gc.collect()
         try:
             self.sta_if.disconnect()
-            time.sleep(2)
+            await uasyncio.sleep(2)
         except OSError:
             # OSError: Wifi Not Started
             # already disconnected, no issue here
@@ -47,7 +205,7 @@ class WifiScifi:
         # bounce before connect attempt
         if self.sta_if.active():
             self.sta_if.active(False)
-            time.sleep(1)
+            await uasyncio.sleep(1)
 
         self.sta_if.active(True)
 
@@ -57,51 +215,120 @@ class WifiScifi:
         time.sleep_us(1000)
         self.sta_if.config(dhcp_hostname=CNFG.DHCP_HOSTNAME)
         time.sleep_us(1000)  # extra sleep before connecting
+        self.use_dhcp()
 
         logger.debug("Connection attempt to WiFi SSID:", ssid)
-        self.sta_if.connect(ssid, pwd)
+        if bssid:
+            self.sta_if.connect(ssid, pwd, bssid=unhexlify(bssid))
+        else:
+            self.sta_if.connect(ssid, pwd)
 
-    def check_wifi_connected(self, ssid, lcd=None):
-        """print current state and set connection counter"""
-        for i in range(0, CNFG.WIFI_CONNECT_TIMEOUT):
-            if not (self.sta_if.isconnected()):
-                msg = f"SSID: {ssid} {'.' * i}"
-                print(msg, end="\r")
-                if lcd:
-                    msg = CNFG.MSG_LCD["conn"](ssid, CNFG.LCD_MAX_CHAR) + "." * i
-                    lcd.longtext(msg, CNFG.LCD_MAX_CHAR)
-                time.sleep(1)
-            else:
+    async def fast_connect(self, ntw_list, lcd=None) -> bool:
+        """targeted connect to the cached BSSID/channel, no interface bounce"""
+        cache = self.cache
+        if not cache or not cache["bssid"] or cache["ssid"] not in ntw_list:
+            return False
+        logger.debug(f"Fast reconnect to {cache['ssid']} / {cache['bssid']}")
+        if self.sta_if.isconnected():
+            self.sta_if.disconnect()
+        if not self.sta_if.active():
+            self.sta_if.active(True)
+            time.sleep_us(1000)
+        # the lease is requested under the port's default name otherwise
+        self.sta_if.config(dhcp_hostname=CNFG.DHCP_HOSTNAME)
+        try:
+            self.sta_if.config(channel=cache["channel"])
+        except (OSError, ValueError):
+            pass  # not supported for STA by every port
+        self.apply_ip_config()
+        self.sta_if.connect(
+            cache["ssid"], ntw_list[cache["ssid"]], bssid=unhexlify(cache["bssid"])
+        )
+        if await self.check_wifi_connected(
+            cache["ssid"], lcd, CNFG.WIFI_FAST_CONNECT_TIMEOUT
+        ):
+            return True
+        logger.info("Fast reconnect failed, falling back to full connect")
+        # the driver keeps retrying the BSSID otherwise and refuses the scan
+        try:
+            self.sta_if.disconnect()
+        except OSError:
+            pass
+        self.drop_cache()
+        return False
+
+    async def check_wifi_connected(
+        self, ssid, lcd=None, timeout=CNFG.WIFI_CONNECT_TIMEOUT
+    ):
+        """poll link status and print progress"""
+        polls = timeout * 1000 // CNFG.WIFI_STATUS_POLL
+        for i in range(0, polls):
+            if self.sta_if.isconnected():
                 if lcd:
                     # print connection success message to OLED
                     msg = CNFG.MSG_LCD["conn"](ssid, CNFG.LCD_MAX_CHAR) + "Connected"
                     lcd.longtext(msg, CNFG.LCD_MAX_CHAR)
                 break
+            if self.sta_if.status() in FAILED_STATUS:
+                # no point waiting for the timeout
+                logger.warn(f"SSID {ssid} refused, status {self.sta_if.status()}")
+                break
+            dots = i * CNFG.WIFI_STATUS_POLL // 1000
+            if not i % (1000 // CNFG.WIFI_STATUS_POLL):
+                msg = f"SSID: {ssid} {'.' * dots}"
+                print(msg, end="\r")
+                if lcd:
+                    msg = CNFG.MSG_LCD["conn"](ssid, CNFG.LCD_MAX_CHAR) + "." * dots
+                    lcd.longtext(msg, CNFG.LCD_MAX_CHAR)
+            await uasyncio.sleep_ms(CNFG.WIFI_STATUS_POLL)
         print()  # newline after the last progress print without it
         logger.info("Wifi connected:", self.sta_if.isconnected())
         logger.info("Wifi config:", self.sta_if.ifconfig())
+        return self.sta_if.isconnected()
 
-        if not self.sta_if.isconnected():
-            self.conn_attempts += 1
-            return False
-        else:
-            self.conn_attempts = 0
-            return True
-
-    def attempt_connection(self, ntw_list=CNFG.NETWORKS, lcd=None, reset=False):
+    async def establish(self, ntw_list=CNFG.NETWORKS, lcd=None, reset=False):
         if not ntw_list:
             # no networks were defined, running offline
             # don't attempt connection, don't autoreboot
             logger.warn("Not attempting Wi-Fi. No networks configured.")
             return
 
-        for ssid, passwd in ntw_list.items():
-            self.connect(ssid, passwd)
-            self.check_wifi_connected(ssid, lcd)
-            if self.sta_if.isconnected():
-                break
+        if reset:
+            metrics.inc("wifi_reconnects_total")
+
+        start = time.ticks_ms()
+        ssid = bssid = channel = None
+        if await self.fast_connect(ntw_list, lcd):
+            ssid, bssid, channel = (
+                self.cache["ssid"],
+                self.cache["bssid"],
+                self.cache["channel"],
+            )
+        else:
+            candidates = await self.scan(ntw_list)
+            if candidates:
+                # only the strongest visible network is worth the timeout
+                ssid, bssid, channel, rssi = candidates[0]
+                logger.info(f"Best network: {ssid} ({rssi} dBm)")
+                await self.connect(ssid, ntw_list[ssid], bssid)
+                if not await self.check_wifi_connected(ssid, lcd):
+                    self.scan_stale = True  # AP may be gone
+            else:
+                logger.warn("None of the configured SSIDs is visible")
+                self.scan_stale = True
 
-        if not self.sta_if.isconnected():
+        self.set_state(self.sta_if.isconnected())
+        if self.up:
+            self.conn_attempts = 0
+            self.connect_ms = time.ticks_diff(time.ticks_ms(), start)
+            metrics.set_gauge("wifi_connect_seconds", self.connect_ms / 1000)
+            logger.info(f"Wi-Fi connected in {self.connect_ms} ms")
+            ssid, bssid, channel = self.link_info(ssid, bssid, channel)
+            # the driver may reconnect on its own, to an SSID we can't name
+            if ssid is not None:
+                self.save_cache(ssid, bssid, channel)
+        else:
+            self.conn_attempts += 1
             logger.info(
                 f"NetworkFail: None of the '{', '.join(ntw_list.keys())}' SSIDs has connected."
             )
@@ -116,41 +343,166 @@ class WifiScifi:
                 )
                 machine.reset()
 
+    def attempt_connection(self, ntw_list=CNFG.NETWORKS, lcd=None, reset=False):
+        """blocking connect, only meant for boot before the event loop runs"""
+        uasyncio.run(self.establish(ntw_list, lcd, reset))
+
+    async def run(self):
+        """connection manager coroutine - owns the link state
+
+        polls the link, reconnects when it drops or a consumer asked for it"""
+        while True:
+            self.set_state(self.sta_if.isconnected())
+            if self.reconnect or (not self.up and CNFG.NETWORKS):
+                self.reconnect = False
+                await self.establish(reset=True)
+                if not self.up:
+                    await uasyncio.sleep(CNFG.WIFI_RETRY_DELAY)
+            await uasyncio.sleep_ms(CNFG.WIFI_LINK_POLL)
+
 
 class NtpSync:
+    """SNTP client keeping the RTC disciplined
+
+    the RTC is re-synced periodically. The drift measured between syncs
+    sets the next interval, so the expected error stays below NTP_MAX_ERROR"""
+
     def __init__(self):
         self.synced = False
+        self.addr = None
+        self.interval = CNFG.NTP_MIN_INTERVAL  # sec. until the next sync
+        self.last_sync = None  # ticks_ms when the RTC was last set
+        self.utc_offset = None  # sec. of timezone + DST the RTC was last set with
+        # metrics
+        self.latency_ms = None
+        self.offset_ms = None
+        self.drift_ppm = None
 
-    def sync_ntp_time(self, wifi):
+    async def query(self) -> int:
+        """single SNTP exchange over UDP, returns UTC epoch in ms
+
+        raises ValueError for replies that must not set the clock"""
+        if self.addr is None:
+            self.addr = usocket.getaddrinfo(CNFG.NTP_HOST, 123)[0][-1]
+        msg = bytearray(48)
+        msg[0] = 0x1B  # LI = 0, VN = 3, mode = client
+        sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            start = time.ticks_ms()
+            sock.sendto(msg, self.addr)
+            while True:
+                try:
+                    msg = sock.recv(48)
+                    break
+                except OSError as exc:
+                    if exc.args[0] != errno.EAGAIN:
+                        raise
+                if time.ticks_diff(time.ticks_ms(), start) > CNFG.HTTP_TIMEOUT * 1000:
+                    raise OSError(errno.ETIMEDOUT)
+                await uasyncio.sleep_ms(10)
+            self.latency_ms = time.ticks_diff(time.ticks_ms(), start)
+        finally:
+            sock.close()
+        if len(msg) != 48:
+            raise ValueError(f"NTP reply of {len(msg)} B")
+        if msg[0] & 7 != 4:
+            raise ValueError(f"NTP reply mode {msg[0] & 7}, not server")
+        if msg[1] == 0:
+            # Kiss-o'-Death, the code is in the reference ID
+            raise ValueError(f"NTP kiss-o'-death {bytes(msg[12:16])}")
+        secs, frac = struct.unpack("!II", msg[40:48])
+        if not secs and not frac:
+            raise ValueError("NTP reply without transmit timestamp")
+        # integer ms - floats are single precision on the ESP32
+        # the server timestamp is half a round trip old when it arrives
+        return (secs - NTP_DELTA) * 1000 + (frac * 1000 >> 32) + self.latency_ms // 2
+
+    async def sync(self, wifi) -> bool:
         """In case we have active and connected wifi, sync RTC via NTP"""
         if not (wifi.sta_if.active()):
             logger.critical("Can't sync NTP. Wifi not active.")
+            return False
         elif not (wifi.sta_if.isconnected()):
             logger.critical("Can't sync NTP. Wifi not connected.")
-        else:
-            try:
+            return False
+        try:
+            utc_ms = await self.query()
+        except (OSError, ValueError) as exc:
+            logger.error(f"Failed to load NTP time. {exc}")
+            # the pool rotates servers, resolve again next time
+            self.addr = None
+            return False
 
-                epoch = ntptime.time()  # get UTC epoch time
-                dt = time.gmtime(epoch)  # split do YMDhms
-                dt = [str(d) for d in dt]  # int to str for concat
-                logger.info(
-                    "NTP UTC time loaded:", "-".join(dt[0:3]), ":".join(dt[3:6])
-                )
-                tzc = self.apply_timezone_dst(epoch)
-                machine.RTC().datetime(
-                    (tzc[0], tzc[1], tzc[2], tzc[6] + 1, tzc[3], tzc[4], tzc[5], 0)
-                )
-                del epoch, dt, tzc
-                self.synced = True
-                # cleanup NTP from imports
-                if "ntptime" in sys.modules:
-                    del sys.modules["ntptime"]
+        epoch, ms = divmod(utc_ms, 1000)
+        dt = time.gmtime(epoch)  # split do YMDhms
+        dt = [str(d) for d in dt]  # int to str for concat
+        logger.info("NTP UTC time loaded:", "-".join(dt[0:3]), ":".join(dt[3:6]))
+        tzc = self.apply_timezone_dst(epoch)
+        utc_offset = time.mktime(tzc) - epoch
+
+        # how far the RTC got off since it was set, compared in UTC so that
+        # a DST switch in between doesn't show up as an hour of error
+        prev_offset = utc_offset if self.utc_offset is None else self.utc_offset
+        self.offset_ms = utc_ms - (rtc_ms() - prev_offset * 1000)
+        if self.last_sync is not None:
+            elapsed = time.ticks_diff(time.ticks_ms(), self.last_sync)
+            if utc_offset != self.utc_offset:
+                logger.info("UTC offset changed since the last sync, drift kept")
+            elif elapsed < CNFG.NTP_MIN_INTERVAL * 1000:
+                # over seconds the offset is just latency noise
+                logger.debug("Too soon after the last sync, drift kept")
+            else:
+                # RTC running fast => negative offset => positive drift
+                self.drift_ppm = -self.offset_ms * 1000000 / elapsed
+                self.discipline()
+
+        machine.RTC().datetime(
+            (tzc[0], tzc[1], tzc[2], tzc[6] + 1, tzc[3], tzc[4], tzc[5], ms * 1000)
+        )
+        self.last_sync = time.ticks_ms()
+        self.utc_offset = utc_offset
+        self.synced = True
+        logger.info(
+            f"RTC synced. Offset {self.offset_ms} ms, latency {self.latency_ms} ms, "
+            f"drift {self.drift_ppm} ppm, next sync in {self.interval} s"
+        )
+        metrics.set_gauge("ntp_latency_seconds", self.latency_ms / 1000)
+        metrics.set_gauge("ntp_offset_seconds", self.offset_ms / 1000)
+        if self.drift_ppm is not None:
+            metrics.set_gauge("ntp_drift_ppm", self.drift_ppm)
+        del epoch, ms, dt, tzc
+        return True
 
-            except OSError as exc:
-                logger.error(f"Failed to load NTP time. {exc}")
+    def discipline(self):
+        """pick the sync interval so the drift stays below NTP_MAX_ERROR ms
+
+        the ESP32 port offers no RTC trimming, so the correction is the
+        periodic step done by sync()"""
+        if not self.drift_ppm:
+            self.interval = CNFG.NTP_MAX_INTERVAL
+            return
+        # error [ms] = drift [ppm] * t [s] / 1000
+        interval = int(CNFG.NTP_MAX_ERROR * 1000 / abs(self.drift_ppm))
+        self.interval = max(CNFG.NTP_MIN_INTERVAL, min(CNFG.NTP_MAX_INTERVAL, interval))
+
+    def sync_ntp_time(self, wifi):
+        """blocking sync, only meant for boot before the event loop runs"""
+        uasyncio.run(self.sync(wifi))
+
+    async def run(self, wifi):
+        """periodic resync coroutine, the boot sync counts as the last one"""
+        while True:
+            if self.synced:
+                due = self.interval * 1000 - time.ticks_diff(
+                    time.ticks_ms(), self.last_sync
+                )
+                if due > 0:
+                    await uasyncio.sleep_ms(due)
+            if not (wifi.is_up() and await self.sync(wifi)):
+                await uasyncio.sleep(CNFG.NTP_RETRY_DELAY)
 
     def apply_timezone_dst(self, utc):
-        # NTP_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800
         # utc += TIMEZONE_UTC_OFFSET * 3600  # apply timezone offset
         DS = daylightsaving.DaylightSaving(
             daylightsaving.DaylightSavingPolicy(0, 0, 3, 6, 2, 120),